@@ -1,9 +1,17 @@
+import time
 import numpy as np
 import permu_utils as putils
 
 from optimizers import UMDA
+from evaluators import FitnessCache
 
 class Algorithm():
+
+    # Per generation instrumentation keys of the log, seconds of each phase
+    # and counters
+    stats_keys = ['time learn', 'time sample', 'time decode', 'time eval', 
+                  'time local search', 'time replace',
+                  'evaluations', 'rejected', 'retries']
     
     def __init__(self,
                  size, 
@@ -15,7 +23,13 @@ class Algorithm():
                  sampling_func,
                  timeout,
                  check_repeat,
-                 permu_dtype=np.int8):
+                 permu_dtype=np.int8,
+                 batch_evaluator=None,
+                 local_search=None,
+                 local_search_target='samples',
+                 cache_size=None,
+                 migration=None,
+                 rng=None):
         '''Algortithm constructor.
             
         Args:
@@ -30,6 +44,29 @@ class Algorithm():
             check_repeat (bool): If true, sampled solutions will be solutions 
                                  that do not exist in the population.
             permu_dtype (numpy dtype): Numpy dtype permutations. Ex.: np.int8.
+            batch_evaluator (func or None): Evaluation function that is given a 
+                              matrix of permutations and returns an array with 
+                              their fitness values. If given, it is used to 
+                              evaluate the initial population and the samples 
+                              of each generation. Default: None.
+            local_search (func or None): Improvement function, is given a 
+                              permutation and returns a tuple with the improved 
+                              permutation and its fitness value 
+                              (Ex.: optimizers.LocalSearch). Default: None.
+            local_search_target (str): Solutions the local search is applied to,
+                              'samples' or 'survivors'. Default: 'samples'.
+            cache_size (int or None): If given, the evaluations are memoized in a
+                              evaluators.FitnessCache of this size. Default: None.
+            migration (object or None): Migration of the island model, with 
+                              interval and n_migrants attributes and an 
+                              exchange(emigrants, emigrants_f) method that returns
+                              the received solutions (Ex.: islands.Migration). 
+                              Default: None.
+            rng (numpy.random.Generator, int, numpy.random.SeedSequence or None):
+                              Random number generator of the run, or the seed 
+                              to create it. Every random decision of the run 
+                              uses it, so runs with the same seed are the same.
+                              Default: None, a generator seeded by the system.
 
         Returns:
             Algorithm instance.
@@ -39,28 +76,158 @@ class Algorithm():
         self.size = size
         self.pop_size = pop_size
         self.evaluate = evaluator
+        self.evaluate_batch = batch_evaluator
+        self.cache = None
+
+        if cache_size is not None:
+            self.cache = FitnessCache(evaluator, 
+                                      maxsize=cache_size, 
+                                      batch_evaluator=batch_evaluator,
+                                      dtype=permu_dtype)
+            self.evaluate = self.cache
+            self.evaluate_batch = self.cache.evaluate_batch
         self.n_surv = int(pop_size*surv_rate)
         self.iters = iters
         self.permu_dtype = permu_dtype
 
         self.umda = UMDA()
 
+        self.local_search = local_search
+        if local_search_target not in ('samples', 'survivors'):
+            print('Please select a valid local search target.')
+            quit()
+        self.local_search_target = local_search_target
+
         self.sampling_func = sampling_func
+        self.migration = migration
+        self.rng = np.random.default_rng(rng)
 
         # Define search space specific variables
         if space == 'permutation':
             self.transform = False
             self.space2permu = None 
+            self.space2permu_batch = None
 
         elif space == 'vj':
             self.transform= True
             self.permu2space = putils.permu2vj
             self.space2permu = putils.vj2permu
+            self.permu2space_batch = putils.permu2vj_batch
+            self.space2permu_batch = putils.vj2permu_batch
 
         else:                                  
             print('Please select a valid search space type.')
             quit()
 
+    def _improve(self, solutions, solutions_f, pop_index=None):
+        '''Applies the local search to every given solution, in place.
+        Improved solutions that already exist in the population, or that 
+        repeat another of the given solutions (Ex.: several samples improved
+        to the same local optimum), are discarded if check_repeat is enabled.
+
+        Args:
+            solutions (ndarray): Matrix of the solutions to improve.
+            solutions_f (ndarray): Fitness array of the given solutions.
+            pop_index (permu_utils.PopulationIndex or None): Hash index of the 
+                                  population, required if check_repeat is 
+                                  enabled. Default: None.
+
+        Returns:
+            list: Indexes of the improved solutions.
+        '''
+        # Keys of the given solutions, updated as they are improved
+        if self.check_repeat:
+            taken = set(pop_index.keys(solutions))
+
+        improved = []
+        for i in range(solutions.shape[0]):
+
+            permu, f = self.local_search(solutions[i])
+
+            if f >= solutions_f[i]:
+                continue
+
+            if self.check_repeat:
+                key = pop_index.key(permu)
+                if key in pop_index.counts or key in taken:
+                    continue
+
+                taken.discard(pop_index.key(solutions[i]))
+                taken.add(key)
+
+            solutions[i] = permu
+            solutions_f[i] = f
+            improved.append(i)
+
+        return improved
+
+    def _replace(self, pop, pop_f, new, new_f, pop_index=None):
+        '''Replaces the best new solutions with the worst solutions from the 
+        population, in place, while the new solutions are not worse.
+
+        Args:
+            pop (ndarray): Population matrix.
+            pop_f (ndarray): Fitness array of the population.
+            new (ndarray): Matrix of the new solutions.
+            new_f (ndarray): Fitness array of the new solutions.
+            pop_index (permu_utils.PopulationIndex or None): Hash index of the 
+                                                             population. Default: None.
+        '''
+        n = min(len(new_f), pop.shape[0])
+        if n == 0:
+            return
+
+        # The n worst solutions of the population, from worst to best
+        worst = np.argpartition(pop_f, pop.shape[0]-n)[pop.shape[0]-n:]
+        worst = worst[np.argsort(pop_f[worst])[::-1]]
+
+        # The n best new solutions, from best to worst
+        best = np.argpartition(new_f, n-1)[:n]
+        best = best[np.argsort(new_f[best])]
+
+        # The new solutions are ordered from best to worst and the replaced 
+        # ones from worst to best, so the replacement stops at the first new 
+        # solution that is worse
+        k = np.count_nonzero(new_f[best] <= pop_f[worst])
+        worst = worst[:k]
+        best = best[:k]
+
+        if pop_index is not None:
+            pop_index.remove_all(pop[worst])
+            pop_index.add_all(new[best])
+
+        pop[worst] = new[best]
+        pop_f[worst] = new_f[best]
+
+    def _migrate(self, pop, pop_f, pop_index=None):
+        '''Sends the best solutions of the population to the other populations
+        and merges the received ones with _replace. Received solutions that 
+        already exist in the population are discarded if check_repeat is 
+        enabled.
+
+        Args:
+            pop (ndarray): Population matrix.
+            pop_f (ndarray): Fitness array of the population.
+            pop_index (permu_utils.PopulationIndex or None): Hash index of the 
+                                                             population. Default: None.
+        '''
+        n = min(self.migration.n_migrants, pop.shape[0])
+        best = np.argpartition(pop_f, n-1)[:n] if n > 0 else np.arange(0)
+        immigrants, immigrants_f = self.migration.exchange(pop[best], pop_f[best])
+
+        if pop_index is not None:
+            keep = []
+            keys = set()
+            for i, permu in enumerate(immigrants):
+                key = pop_index.key(permu)
+                if key not in pop_index.counts and key not in keys:
+                    keys.add(key)
+                    keep.append(i)
+            immigrants = immigrants[keep]
+            immigrants_f = immigrants_f[keep]
+
+        self._replace(pop, pop_f, immigrants, immigrants_f, pop_index)
+
     # @profile
     def run(self, verbose=True):
         '''Runs the algorithm with the given parameters in the constructor.
@@ -70,18 +237,28 @@ class Algorithm():
                             iteration.
         Returns:
             log (dict): a dictionary with 'min', 'max', 'mean' and 'median' keys,
-                        storing data of each generation.
+                        storing data of each generation. It also has the keys
+                        of stats_keys: the seconds spent in each phase of the 
+                        generation (learning includes the selection and the 
+                        encoding of the survivors, replacement includes the 
+                        migration), the number of evaluations, the rejected 
+                        repeated samples and the extra sampling batches. The
+                        first generation includes the initial population.
         '''
         # Init loggers
         log = {'min':[],
                'max':[],
                'mean':[],
                'median':[]}
+
+        for key in self.stats_keys:
+            log[key] = []
     
         # Sample initial random population
         pop = putils.random_population(self.size,
                                        self.pop_size,
-                                       self.permu_dtype)
+                                       self.permu_dtype,
+                                       rng=self.rng)
         # Initialize fitness array 
         pop_f = np.empty(self.pop_size)
 
@@ -96,8 +273,21 @@ class Algorithm():
         samples_f = np.empty(self.n_surv)
         
         # Evaluate initial population
-        for i in range(self.pop_size):
-            pop_f[i] = self.evaluate(pop[i])
+        t_init = time.perf_counter()
+
+        if self.evaluate_batch is not None:
+            pop_f[:] = self.evaluate_batch(pop)
+        else:
+            for i in range(self.pop_size):
+                pop_f[i] = self.evaluate(pop[i])
+
+        t_init = time.perf_counter() - t_init
+
+        # Index of the population to check repeated solutions
+        if self.check_repeat:
+            pop_index = putils.PopulationIndex(pop, self.permu_dtype)
+        else:
+            pop_index = None
 
         ### MAIN LOOP ###
 
@@ -130,25 +320,45 @@ class Algorithm():
                       ' mean: ', log['mean'][-1],
                       ' best: ', log['min'][-1])
 
-            # Order from min to max fitness values, index list
-            ranking = np.argsort(pop_f)
+            stats = dict.fromkeys(self.stats_keys, 0)
 
-            # Select best solutions
-            ranking = ranking[:self.n_surv]
-            
-            for i, indx in enumerate(ranking):
-                surv[i] = pop[indx]
-                surv_f[i] = pop_f[indx]
+            if iter_ == 0:
+                stats['time eval'] += t_init
+                stats['evaluations'] += self.pop_size
+
+            t_learn = time.perf_counter()
+
+            # Select best solutions, in no particular order
+            ranking = np.argpartition(pop_f, self.n_surv-1)[:self.n_surv]
+
+            np.take(pop, ranking, axis=0, out=surv)
+            np.take(pop_f, ranking, out=surv_f)
 
+            if self.local_search is not None and self.local_search_target == 'survivors':
+                t_ls = time.perf_counter()
+
+                improved = self._improve(surv, surv_f, pop_index)
+
+                if pop_index is not None:
+                    for i in improved:
+                        pop_index.remove(pop[ranking[i]])
+                        pop_index.add(surv[i])
+
+                pop[ranking] = surv
+                pop_f[ranking] = surv_f
+
+                stats['time local search'] += time.perf_counter() - t_ls
 
             if self.transform:
                 # Transform survivors
-                surv_transformed = putils.transform(surv, self.permu2space)
+                surv_transformed = self.permu2space_batch(surv)
 
                 p = self.umda.learn_distribution(surv_transformed, self.size)
             else:
                 p = self.umda.learn_distribution(surv, self.size)
 
+            stats['time learn'] = time.perf_counter() - t_learn - stats['time local search']
+
             # putils.fancy_matrix_plot(p, title=str(p.shape))
             
             # Sample new solutions
@@ -161,35 +371,31 @@ class Algorithm():
                                                              eval_func=self.evaluate,
                                                              transformation=self.space2permu,
                                                              check_repeat=self.check_repeat,
-                                                             timeout=self.timeout)
+                                                             timeout=self.timeout,
+                                                             batch_eval_func=self.evaluate_batch,
+                                                             pop_index=pop_index,
+                                                             batch_transformation=self.space2permu_batch,
+                                                             stats=stats,
+                                                             rng=self.rng)
 
-            # Ranking, the best fitness valued solutions index
-            ranking = np.argsort(pop_f)
-
-            ranking_samples = np.argsort(samples_f)
-            
-            # Replace the best new solutions with the 
-            # worst solutions from the population
-
-            indexes = list(reversed(range(self.pop_size)))
-
-            stop = False
-            i = 0
-            
-            while i < self.n_surv and not stop:
+            if self.local_search is not None and self.local_search_target == 'samples':
+                t_ls = time.perf_counter()
+                self._improve(samples, samples_f, pop_index)
+                stats['time local search'] += time.perf_counter() - t_ls
 
-                worst_pop = ranking[indexes[i]]
-                best_sample = ranking_samples[i]
+            t_replace = time.perf_counter()
 
-                if samples_f[best_sample] <= pop_f[worst_pop]:
+            # Replace the worst solutions of the population
+            self._replace(pop, pop_f, samples, samples_f, pop_index)
 
-                    pop[worst_pop] = samples[best_sample]
-                    pop_f[worst_pop] = samples_f[best_sample]
+            # Exchange solutions with other populations
+            if self.migration is not None and (iter_+1) % self.migration.interval == 0:
+                self._migrate(pop, pop_f, pop_index)
 
-                else:
-                    stop = True
+            stats['time replace'] = time.perf_counter() - t_replace
 
-                i += 1
+            for key in self.stats_keys:
+                log[key].append(stats[key])
 
         return log
                 
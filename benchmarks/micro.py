@@ -0,0 +1,291 @@
+'''Microbenchmarks of the evaluators, samplers, codecs and helpers.
+
+The evaluators are timed on the instances shipped in instances/ (parsed,
+and loaded through the binary cache from a temporary copy) and on
+synthetic instances, the rest, including the sampling of a whole
+generation (UMDA.sample_population_v2), on synthetic sizes. The best time per call
+of each benchmark is written to a JSON file, two files (Ex.: of two
+commits) can be compared with --compare.
+
+Usage:
+    python benchmarks/micro.py [-o OUT] [-n SIZES] [-k FILTER] [-t MIN_TIME]
+    python benchmarks/micro.py --compare OLD.json NEW.json
+'''
+import os
+import sys
+import glob
+import json
+import shutil
+import tempfile
+import time
+import platform
+import argparse
+import datetime
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common import git_commit
+
+import problems
+import permu_utils as putils
+from optimizers import UMDA
+
+# Solutions in each call of the batch functions
+BATCH = 100
+
+def time_call(func, min_time=.05, repeat=3):
+    '''Best time per call of a function. The number of calls of each
+    measure is increased until the measure takes at least min_time.
+
+    Args:
+        func (function): Function without arguments.
+        min_time (float): Minimum seconds of each measure. Default: 0.05.
+        repeat (int): Number of measures. Default: 3.
+
+    Returns:
+        tuple(float, int): Seconds per call and calls in each measure.
+    '''
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+
+    best = elapsed
+    for _ in range(repeat-1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+
+    return best / number, number
+
+def shipped_instances(cache_dir=None):
+    '''QAP and PFSP instances of instances/ that can be read.
+
+    Args:
+        cache_dir (str or None): If given, each instance is copied to this 
+                                 directory and loaded through its binary 
+                                 cache (problems.cache), as the launcher 
+                                 does. Else the instance file is parsed, 
+                                 no cache is written. Default: None.
+
+    Returns:
+        list: (problem name, instance name, instance) of each instance, the
+              instance is (distance, flow) for QAP and the matrix for PFSP.
+    '''
+    found = []
+    for problem_name, problem, pattern in (('QAP', problems.QAP(), 'instances/QAP/*'),
+                                           ('PFSP', problems.PFSP(), 'instances/PFSP/*')):
+        for path in sorted(glob.glob(os.path.join(ROOT, pattern))):
+            if path.endswith('.npy'):
+                continue
+            try:
+                if cache_dir is None:
+                    instance = problem.load_instance(path, cache=False)
+                else:
+                    copy = os.path.join(cache_dir, os.path.basename(path))
+                    shutil.copyfile(path, copy)
+                    instance = problem.load_instance(copy, cache=True)
+            except Exception:
+                continue
+            found.append((problem_name, os.path.basename(path), instance))
+
+    return found
+
+def cases(sizes, cache_dir):
+    '''Benchmarks to run.
+
+    Args:
+        sizes (list): Synthetic problem sizes.
+        cache_dir (str): Directory of the copies of the instances loaded 
+                         through the binary cache.
+
+    Yields:
+        tuple: (name, case, n, function without arguments).
+    '''
+    rng = np.random.RandomState(0)
+    gen = np.random.default_rng(0) # Random numbers of the samplers
+    qap = problems.QAP()
+    pfsp = problems.PFSP()
+    umda = UMDA()
+
+    instances = [(name, 'file:'+instance_name, instance)
+                 for name, instance_name, instance in shipped_instances()]
+    instances += [(name, 'cached:'+instance_name, instance)
+                  for name, instance_name, instance in shipped_instances(cache_dir)]
+
+    for n in sizes:
+        instances.append(('QAP', 'synthetic', (rng.randint(0, 100, (n, n)),
+                                               rng.randint(0, 100, (n, n)))))
+        instances.append(('PFSP', 'synthetic', rng.randint(1, 100, (20, n))))
+
+    # Evaluators
+    for name, case, instance in instances:
+        if name == 'QAP':
+            dist, flow = instance
+            n = dist.shape[0]
+            permu = rng.permutation(n)
+            pop = np.array([rng.permutation(n) for _ in range(BATCH)])
+
+            yield ('QAP.evaluate', case, n,
+                   lambda permu=permu, d=dist, f=flow: qap.evaluate(permu, d, f))
+            yield ('QAP.evaluate_batch x'+str(BATCH), case, n,
+                   lambda pop=pop, d=dist, f=flow: qap.evaluate_batch(pop, d, f))
+
+        else:
+            n = instance.shape[1]
+            permu = rng.permutation(n)
+            pop = np.array([rng.permutation(n) for _ in range(BATCH)])
+
+            yield ('PFSP.evaluate', case, n,
+                   lambda permu=permu, t=instance: pfsp.evaluate(permu, t))
+            yield ('PFSP.evaluate_batch x'+str(BATCH), case, n,
+                   lambda pop=pop, t=instance: pfsp.evaluate_batch(pop, t))
+
+    # Samplers, distribution learning, codecs and helpers
+    for n in sizes:
+        dtype = np.int16 if n > 127 else np.int8
+        pop = np.array([rng.permutation(n) for _ in range(BATCH)], dtype=dtype)
+        vj = putils.permu2vj_batch(pop)
+        p = umda.learn_distribution(pop, n).astype(np.float64)
+
+        for sampler in ('sample_ad_hoc_laplace', 'sample_ad_hoc_laplace_random',
+                        'sample_no_restriction', 'sample_no_restriction_random'):
+            func = getattr(umda, sampler)
+            yield ('UMDA.'+sampler, 'synthetic', n,
+                   lambda func=func, p=p, n=n, dtype=dtype: func(p, n, dtype=dtype, rng=gen))
+
+        yield ('UMDA.sample_no_restriction_batch x'+str(BATCH), 'synthetic', n,
+               lambda p=p, n=n, dtype=dtype: umda.sample_no_restriction_batch(p, n, BATCH, dtype=dtype, rng=gen))
+        yield ('UMDA.sample_ad_hoc_laplace_batch x'+str(BATCH), 'synthetic', n,
+               lambda p=p, n=n, dtype=dtype: umda.sample_ad_hoc_laplace_batch(p, n, BATCH, dtype=dtype, rng=gen))
+        yield ('UMDA.learn_distribution x'+str(BATCH), 'synthetic', n,
+               lambda pop=pop, n=n: umda.learn_distribution(pop, n))
+
+        # Sampling of a whole generation, on a QAP instance
+        dist, flow = rng.randint(0, 100, (n, n)), rng.randint(0, 100, (n, n))
+        pop_f = qap.evaluate_batch(pop, dist, flow)
+        pop_index = putils.PopulationIndex(pop, dtype)
+        samples = np.empty((BATCH, n), dtype=dtype)
+        samples_f = np.empty(BATCH)
+
+        # The legacy sampling takes seconds per generation for larger sizes
+        if n <= 100:
+            yield ('UMDA.sample_population x'+str(BATCH), 'permutation', n,
+                   lambda p=p, pop=pop, pop_f=pop_f, s=samples, s_f=samples_f, d=dist, f=flow:
+                       umda.sample_population(p, s, s_f, pop, pop_f, 
+                                              lambda permu: qap.evaluate(permu, d, f), 
+                                              True, rng=gen))
+
+        for space, sampling, q, transformation in (
+                ('permutation', 'ad-hoc-laplace', p, None), 
+                ('vj', 'no-restriction', umda.learn_distribution(vj, n).astype(np.float64), 
+                 putils.vj2permu_batch)):
+            sampling_func = umda.get_sampling_func(sampling)
+
+            yield ('UMDA.sample_population_v2 x'+str(BATCH), space+'/'+sampling, n,
+                   lambda q=q, func=sampling_func, t=transformation, pop=pop, pop_f=pop_f, 
+                          index=pop_index, s=samples, s_f=samples_f, d=dist, f=flow:
+                       umda.sample_population_v2(q, func, s, s_f, pop, pop_f, None, None, True,
+                                                 batch_eval_func=lambda b: qap.evaluate_batch(b, d, f),
+                                                 pop_index=index, batch_transformation=t, rng=gen))
+
+        yield ('permu2vj', 'synthetic', n, lambda permu=pop[0]: putils.permu2vj(permu))
+        yield ('vj2permu', 'synthetic', n, lambda v=vj[0]: putils.vj2permu(v))
+        yield ('permu2vj_batch x'+str(BATCH), 'synthetic', n,
+               lambda pop=pop: putils.permu2vj_batch(pop))
+        yield ('vj2permu_batch x'+str(BATCH), 'synthetic', n,
+               lambda v=vj: putils.vj2permu_batch(v))
+        yield ('random_population x'+str(BATCH), 'synthetic', n,
+               lambda n=n, dtype=dtype: putils.random_population(n, BATCH, dtype, rng=gen))
+
+def run(sizes, pattern=None, min_time=.05, repeat=3):
+    '''Runs the benchmarks.
+
+    Args:
+        sizes (list): Synthetic problem sizes.
+        pattern (str or None): Only the benchmarks with this text in their
+                               name. Default: None.
+        min_time (float): Minimum seconds of each measure. Default: 0.05.
+        repeat (int): Number of measures of each benchmark. Default: 3.
+
+    Returns:
+        dict: 'meta' with the commit, versions and date, and 'results' with a
+              dict for each benchmark.
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, case, n, func in cases(sizes, cache_dir):
+            if pattern is not None and pattern not in name:
+                continue
+
+            seconds, number = time_call(func, min_time, repeat)
+
+            results.append({'name': name, 'case': case, 'n': n,
+                            'seconds': seconds, 'number': number, 'repeat': repeat})
+
+            print('{:<40} {:<28} n={:<4} {:12.3f} us'.format(name, case, n, seconds*1e6))
+
+    meta = {'commit': git_commit(),
+            'date': str(datetime.datetime.now()),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor()}
+
+    return {'meta': meta, 'results': results}
+
+def compare(old, new):
+    '''Prints the time ratio (new / old) of the benchmarks found in both
+    results files.
+
+    Args:
+        old (dict): Results loaded from the first JSON file.
+        new (dict): Results loaded from the second JSON file.
+    '''
+    def key(r):
+        return (r['name'], r['case'], r['n'])
+
+    old_results = {key(r): r for r in old['results']}
+
+    print('old: ', old['meta']['commit'], ' new: ', new['meta']['commit'])
+    for r in new['results']:
+        if key(r) not in old_results:
+            continue
+
+        ratio = r['seconds'] / old_results[key(r)]['seconds']
+        print('{:<40} {:<28} n={:<4} {:8.2f}x'.format(r['name'], r['case'], r['n'], ratio))
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Microbenchmarks')
+    parser.add_argument('-o', '--out', help='Output JSON file', type=str, default='micro.json')
+    parser.add_argument('-n', '--sizes', help='Synthetic problem sizes, comma separated',
+                        type=str, default='20,50,100,200,500')
+    parser.add_argument('-k', '--filter', help='Only the benchmarks with this text in their name',
+                        type=str, default=None)
+    parser.add_argument('-t', '--min-time', help='Minimum seconds of each measure',
+                        type=float, default=.05)
+    parser.add_argument('-r', '--repeat', help='Measures of each benchmark', type=int, default=3)
+    parser.add_argument('--compare', help='Compare two results files', nargs=2,
+                        metavar=('OLD', 'NEW'), default=None)
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            compare(json.load(f_old), json.load(f_new))
+        sys.exit(0)
+
+    results = run([int(n) for n in args.sizes.split(',')],
+                  args.filter, args.min_time, args.repeat)
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=1)
@@ -0,0 +1,124 @@
+'''Checks the incremental evaluation of the local search neighbourhoods
+against the evaluators of the problems.
+
+QAPSwapNeighbourhood: the fitness and every entry of the delta matrix,
+after setting a solution and after each applied move, are compared with
+QAP.evaluate of the swapped permutations. PFSPInsertNeighbourhood: the
+objective of every insertion of every job, for the makespan and the total
+flow time, is compared with PFSP.evaluate of the new sequence.
+
+The shipped instances and small random instances are checked. The check
+fails (exit code 1) if a value differs.
+
+Usage: python benchmarks/neighbourhoods.py [-n SOLUTIONS] [-s SEED]
+'''
+import os
+import sys
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from problems import QAP, PFSP, QAPSwapNeighbourhood, PFSPInsertNeighbourhood
+
+def check_qap(dist, flow, n_solutions, rng):
+    '''Compares the delta matrix of QAPSwapNeighbourhood with QAP.evaluate.
+
+    Returns:
+        int: Number of values that differ.
+    '''
+    qap = QAP()
+    size = dist.shape[0]
+    neighbourhood = QAPSwapNeighbourhood(dist, flow)
+
+    errors = 0
+    for _ in range(n_solutions):
+        f = neighbourhood.set_solution(rng.permutation(size))
+
+        # The deltas are checked again after some moves, as they are updated
+        for _ in range(3):
+            perm = neighbourhood.perm
+            errors += f != qap.evaluate(perm, dist, flow)
+
+            for r in range(size):
+                for s in range(size):
+                    swapped = perm.copy()
+                    swapped[[r, s]] = swapped[[s, r]]
+                    errors += neighbourhood.deltas[r, s] != qap.evaluate(swapped, dist, flow) - f
+
+            r, s = rng.choice(size, 2, replace=False)
+            neighbourhood.apply_move((r, s))
+            f = neighbourhood.fitness
+
+    return int(errors)
+
+def check_pfsp(times, n_solutions, rng):
+    '''Compares the insertion objectives of PFSPInsertNeighbourhood with
+    PFSP.evaluate, for the makespan and the total flow time.
+
+    Returns:
+        int: Number of values that differ.
+    '''
+    pfsp = PFSP()
+    n_jobs = times.shape[1]
+
+    errors = 0
+    for makespan in (True, False):
+        neighbourhood = PFSPInsertNeighbourhood(times, makespan=makespan)
+
+        for _ in range(n_solutions):
+            perm = rng.permutation(n_jobs)
+            errors += neighbourhood.set_solution(perm) != pfsp.evaluate(perm, times, makespan=makespan)
+
+            for i in range(n_jobs):
+                sequence = np.delete(perm, i)
+                values = neighbourhood.insert_objectives(sequence, perm[i])
+
+                for k in range(n_jobs):
+                    new = np.insert(sequence, k, perm[i])
+                    errors += values[k] != pfsp.evaluate(new, times, makespan=makespan)
+
+    return int(errors)
+
+def instances(rng):
+    '''Instances to check, the shipped ones that can be read and small
+    random ones.
+
+    Yields:
+        tuple: (problem name, instance name, instance).
+    '''
+    for name in ('nug20.dat', 'bur26a.dat', 'tai20b.dat'):
+        yield 'QAP', name, QAP().load_instance(os.path.join(ROOT, 'instances/QAP', name), cache=False)
+
+    for name in ('tai20_5_0.fsp', 'tai20_10_0.fsp'):
+        yield 'PFSP', name, PFSP().load_instance(os.path.join(ROOT, 'instances/PFSP', name), cache=False)
+
+    for size in (2, 3, 7):
+        yield 'QAP', 'random-'+str(size), (rng.integers(0, 10, (size, size)),
+                                           rng.integers(0, 10, (size, size)))
+        yield 'PFSP', 'random-'+str(size), rng.integers(1, 10, (4, size))
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Neighbourhood evaluation check')
+    parser.add_argument('-n', '--solutions', help='Random solutions of each instance',
+                        type=int, default=2)
+    parser.add_argument('-s', '--seed', help='Seed of the random solutions', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    failed = False
+    for problem_name, name, instance in instances(rng):
+        if problem_name == 'QAP':
+            errors = check_qap(instance[0], instance[1], args.solutions, rng)
+        else:
+            errors = check_pfsp(instance, args.solutions, rng)
+
+        failed = failed or errors > 0
+        print('{:<5} {:<16} {}'.format(problem_name, name,
+                                       'ok' if errors == 0 else 'FAIL, ' + str(errors) + ' values differ'))
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,91 @@
+'''Startup time of the launcher and the modules of the package.
+
+Each command is run in a new interpreter, the best time of the repetitions 
+is reported. The benchmark fails (exit code 1) if a command imports a 
+plotting or report module (matplotlib, pandas or seaborn), or if it takes 
+longer than the given limit.
+
+Usage: python benchmarks/startup.py [-r REPEAT] [-l LIMIT]
+'''
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Name of each command and the arguments of the interpreter
+COMMANDS = [('launcher', ['launcher.py', '-h']),
+            ('algorithm', ['-c', 'import algorithm']),
+            ('islands', ['-c', 'import islands']),
+            ('dbman', ['-c', 'import dbman'])]
+
+# Modules that must only be loaded when plotting or reporting
+LAZY_MODULES = ['matplotlib', 'pandas', 'seaborn']
+
+def imported_modules(args):
+    '''Top level modules imported by the interpreter with the given arguments.
+
+    Args:
+        args (list): Arguments of the interpreter.
+
+    Returns:
+        set: Names of the imported top level modules.
+    '''
+    out = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=ROOT,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                         universal_newlines=True).stderr
+
+    modules = set()
+    for line in out.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            modules.add(line.split('|')[-1].strip().split('.')[0])
+
+    return modules
+
+def startup_time(args, repeat):
+    '''Best wall time of running the interpreter with the given arguments.
+
+    Args:
+        args (list): Arguments of the interpreter.
+        repeat (int): Number of runs.
+
+    Returns:
+        float: Time in seconds.
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=ROOT, 
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Startup time benchmark')
+    parser.add_argument('-r', '--repeat', help='Runs of each command', type=int, default=5)
+    parser.add_argument('-l', '--limit', help='Maximum startup time in seconds', 
+                        type=float, default=None)
+    args = parser.parse_args()
+
+    failed = False
+    for name, command in COMMANDS:
+        t = startup_time(command, args.repeat)
+        lazy = sorted(m for m in imported_modules(command) if m in LAZY_MODULES)
+
+        status = 'ok'
+        if len(lazy) > 0:
+            status = 'FAIL, imports ' + ', '.join(lazy)
+            failed = True
+
+        elif args.limit is not None and t > args.limit:
+            status = 'FAIL, over the limit of ' + str(args.limit) + 's'
+            failed = True
+
+        print('{:<10} {:8.3f}s  {}'.format(name, t, status))
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,207 @@
+'''Throughput of the whole generation loop, Algorithm.run, on a fixed matrix
+of problems, instances, search spaces and sampling functions with fixed
+seeds.
+
+Each case reports the generations and evaluations per second of the best
+of the repetitions. With --save-baseline the results are written to the
+baseline file, else they are compared with it: the benchmark fails (exit
+code 1) if the throughput of a case drops more than the tolerance.
+
+Usage:
+    python benchmarks/throughput.py --save-baseline [-b BASELINE]
+    python benchmarks/throughput.py [-b BASELINE] [--tolerance TOLERANCE]
+'''
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common import git_commit
+
+import problems
+from optimizers import UMDA
+from algorithm import Algorithm
+
+# Problem, instance, search space and sampling function of each case. The
+# no-restriction samplers are only valid in the Vj space
+CASES = [('QAP', 'instances/QAP/tai20b.dat', 'permutation', 'ad-hoc-laplace'),
+         ('QAP', 'instances/QAP/tai20b.dat', 'vj', 'no-restriction'),
+         ('QAP', 'instances/QAP/bur26a.dat', 'permutation', 'ad-hoc-laplace-random'),
+         ('QAP', 'instances/QAP/bur26a.dat', 'vj', 'no-restriction-random'),
+         ('PFSP', 'instances/PFSP/tai20_10_0.fsp', 'permutation', 'ad-hoc-laplace'),
+         ('PFSP', 'instances/PFSP/tai20_10_0.fsp', 'vj', 'no-restriction')]
+
+# Parameters of the algorithm, the same in every case
+PARAMS = {'pop size': 200,
+          'survivor rate': .5,
+          'timeout': 5000,
+          'check repeat': True}
+
+def case_name(case):
+    '''Name of a case, Ex.: QAP/tai20b.dat/permutation/ad-hoc-laplace.
+    '''
+    problem_name, instance, space, sampling = case
+    return '/'.join([problem_name, os.path.basename(instance), space, sampling])
+
+def run_case(case, iters, seed):
+    '''Runs the algorithm on a case.
+
+    Args:
+        case (tuple): Problem name, instance path, space and sampling function.
+        iters (int): Number of generations.
+        seed (int): Seed of the random number generator of the run.
+
+    Returns:
+        tuple(float, int, float): Seconds of Algorithm.run, number of
+                                  evaluations and best fitness found.
+    '''
+    problem_name, instance, space, sampling = case
+    problem = problems.load_problem(problem_name, os.path.join(ROOT, instance))
+    umda = UMDA()
+
+    alg = Algorithm(size=problem['size'],
+                    pop_size=PARAMS['pop size'],
+                    evaluator=problem['evaluator'],
+                    surv_rate=PARAMS['survivor rate'],
+                    iters=iters,
+                    space=space,
+                    sampling_func=umda.get_sampling_func(sampling),
+                    timeout=PARAMS['timeout'],
+                    check_repeat=PARAMS['check repeat'],
+                    batch_evaluator=problem['batch_evaluator'],
+                    rng=seed)
+
+    start = time.perf_counter()
+    log = alg.run(verbose=False)
+    elapsed = time.perf_counter() - start
+
+    return elapsed, int(sum(log['evaluations'])), float(log['min'][-1])
+
+def run(iters=200, repeat=5, seed=0):
+    '''Runs every case, the best time of the repetitions of each case is kept.
+
+    Args:
+        iters (int): Number of generations of each run. Default: 200.
+        repeat (int): Runs of each case. Default: 5.
+        seed (int): Seed of every run. Default: 0.
+
+    Returns:
+        dict: 'meta' with the commit, versions and parameters, and 'results'
+              with the throughput of each case by its name.
+    '''
+    # The repetitions are interleaved, so that a slow period of the machine
+    # does not affect every run of a case
+    runs = {case: [] for case in CASES}
+    for _ in range(repeat):
+        for case in CASES:
+            runs[case].append(run_case(case, iters, seed))
+
+    results = {}
+    for case in CASES:
+        elapsed, evaluations, best = min(runs[case])
+
+        results[case_name(case)] = {'seconds': elapsed,
+                                    'generations/s': iters / elapsed,
+                                    'evaluations/s': evaluations / elapsed,
+                                    'evaluations': evaluations,
+                                    'best': best}
+
+    meta = {'commit': git_commit(),
+            'date': str(datetime.datetime.now()),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'iterations': iters,
+            'repeat': repeat,
+            'seed': seed,
+            'params': PARAMS}
+
+    return {'meta': meta, 'results': results}
+
+def compare(baseline, current, tolerance):
+    '''Prints the throughput of each case relative to the baseline.
+
+    Args:
+        baseline (dict): Results of the baseline.
+        current (dict): Results of this run.
+        tolerance (float): Maximum relative drop of the throughput,
+                           Ex.: 0.2 is a 20% drop.
+
+    Returns:
+        bool: True if no case dropped more than the tolerance.
+    '''
+    passed = True
+    for name, result in current['results'].items():
+        line = '{:<50} {:9.1f} gen/s {:11.1f} eval/s'.format(
+                    name, result['generations/s'], result['evaluations/s'])
+
+        if name not in baseline['results']:
+            print(line, '  (not in the baseline)')
+            continue
+
+        # Evaluations per second also catches the runs that do more work
+        # per generation
+        ratio = min(result[key] / baseline['results'][name][key]
+                    for key in ('generations/s', 'evaluations/s'))
+
+        status = 'ok'
+        if ratio < 1 - tolerance:
+            status = 'FAIL'
+            passed = False
+
+        # The runs are seeded, a different number of evaluations means that
+        # the work of the case changed
+        if result['evaluations'] != baseline['results'][name]['evaluations']:
+            status += ', evaluations changed from ' + str(baseline['results'][name]['evaluations'])
+
+        print(line, ' {:6.2f}x  {}'.format(ratio, status))
+
+    return passed
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Throughput benchmark')
+    parser.add_argument('-b', '--baseline', help='Baseline JSON file', type=str,
+                        default='throughput_baseline.json')
+    parser.add_argument('--save-baseline', help='Save the results as the baseline',
+                        action='store_true')
+    parser.add_argument('--tolerance', help='Maximum relative drop of the throughput',
+                        type=float, default=.2)
+    parser.add_argument('-i', '--iters', help='Generations of each run', type=int, default=200)
+    parser.add_argument('-r', '--repeat', help='Runs of each case', type=int, default=5)
+    parser.add_argument('-s', '--seed', help='Seed of every run', type=int, default=0)
+    args = parser.parse_args()
+
+    results = run(args.iters, args.repeat, args.seed)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+
+        for name, result in results['results'].items():
+            print('{:<50} {:9.1f} gen/s {:11.1f} eval/s'.format(
+                    name, result['generations/s'], result['evaluations/s']))
+        print('Baseline saved in ', args.baseline)
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print('Baseline ', args.baseline, ' not found, create it with --save-baseline.')
+        sys.exit(1)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    if baseline['meta']['iterations'] != args.iters:
+        print('Warning: the baseline ran ', baseline['meta']['iterations'],
+              ' generations, this run ', args.iters)
+
+    if not compare(baseline, results, args.tolerance):
+        sys.exit(1)
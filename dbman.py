@@ -1,17 +1,60 @@
 import glob
+import os
 import configparser
 import csv
 import numpy as np
-import matplotlib.pyplot as plt
 import datetime
 import uuid
+import concurrent.futures
+import itertools
 
 import problems
 from optimizers import UMDA
 
 from algorithm import Algorithm
-
-import pandas as pd
+from islands import IslandModel
+from resultstore import ResultStore
+
+def _run_repetition(params, seed):
+    '''Runs a repetition of an experiment, it can be run in a worker process.
+
+    Args:
+        params (dict): Parameters of the experiment, as built by 
+                       DBMan.run_experiment.
+        seed (numpy.random.SeedSequence): Seed of the random stream of the 
+                                          repetition.
+
+    Returns:
+        dict: log of the algorithm.
+    '''
+    if params['islands'] > 1:
+        model = IslandModel(params,
+                            n_islands=params['islands'],
+                            topology=params['topology'],
+                            interval=params['migration interval'],
+                            n_migrants=params['migrants'],
+                            seed=seed)
+
+        log, _ = model.run()
+        return log
+
+    umda = UMDA()
+    problem = problems.load_problem(params['problem'], params['instance'])
+
+    alg = Algorithm(size=problem['size'],
+                    pop_size=params['pop size'],
+                    evaluator=problem['evaluator'],
+                    surv_rate=params['survivor rate'],
+                    iters=params['iterations'],
+                    space=params['space'],
+                    sampling_func=umda.get_sampling_func(params['sampling']),
+                    timeout=params['timeout'],
+                    check_repeat=params['check repeat'],
+                    permu_dtype=params['permutation dtype'],
+                    batch_evaluator=problem['batch_evaluator'],
+                    rng=np.random.default_rng(seed))
+
+    return alg.run(verbose=params['verbose'])
 
 class DBMan():
     
@@ -31,6 +74,8 @@ class DBMan():
         self.main_log_fields = ['id', 'date', 'problem name', 'instance','max iterations',
                                 'iterations', 'space', 'sampling', 'pop size', 'check repeat', 'min']
 
+        self.store_name = 'results.db'
+
     def create_config(self, config_f=None):
         '''Creates a defaut configuration file. 
         If the path is not specified, it will be created as: config.cfg.
@@ -43,6 +88,7 @@ class DBMan():
 
         self.config['MAIN'] = {
             'repetitions': '1',
+            'workers': '1',
             'search space': 'permutation',
             'sampling': 'ad-hoc-laplace',
             'population size': '200',
@@ -57,9 +103,16 @@ class DBMan():
         self.config.set('INSTANCE', 'path', 'instances/QAP/tai20b.dat')
         self.config.set('INSTANCE', 'size', '20')
 
+        self.config['ISLANDS'] = {
+            'islands': '1',
+            'topology': 'ring',
+            'migration interval': '10',
+            'migrants': '2'}
+
         self.config['DATA'] = {
             'save log': 'True',
             'plot': 'False',
+            'sink': 'sqlite',
             'db path':'db/QAP/'}
 
         with open(config_f, 'w') as configfile:
@@ -84,15 +137,54 @@ class DBMan():
 
         return self.config
 
-    def run_experiment(self):
+    def _expand_config(self, config):
+        '''Expands the list-valued keys (comma separated values) of the MAIN, 
+        INSTANCE and ISLANDS sections into the cartesian product of their 
+        values. The repetitions and workers keys are not expanded.
+
+        Args:
+            config: Configuration file instance.
+
+        Returns:
+            list: One configparser.ConfigParser for each combination of values.
+        '''
+        keys = []
+        values = []
+        for section in ('MAIN', 'INSTANCE', 'ISLANDS'):
+            if not config.has_section(section):
+                continue
+            for key, value in config[section].items():
+                keys.append((section, key))
+                if key in ('repetitions', 'workers'):
+                    values.append([value])
+                else:
+                    values.append([v.strip() for v in value.split(',')])
+
+        combinations = []
+        for combination in itertools.product(*values):
+            job_config = configparser.ConfigParser()
+            for (section, key), value in zip(keys, combination):
+                if not job_config.has_section(section):
+                    job_config.add_section(section)
+                job_config.set(section, key, value)
+            combinations.append(job_config)
+
+        return combinations
+
+    def _job_params(self, config):
+        '''Reads the parameters of a run from a configuration without 
+        list-valued keys.
+
+        Args:
+            config: Configuration instance, as returned by _expand_config.
 
+        Returns:
+            dict or None: Parameters of the run, as used by _run_repetition. 
+                          None if the sampling function does not work in the
+                          search space.
+        '''
         umda = UMDA()
-        
-        config = self._read_config()
 
-        print('[*] Config file read succsessfully.')
-        
-        repetitions = int(config['MAIN']['repetitions'])
         space = config['MAIN']['search space']
         sampling = config['MAIN']['sampling']
         pop_size = int(config['MAIN']['population size'])
@@ -102,16 +194,14 @@ class DBMan():
         timeout = int(config['MAIN']['timeout'])
         permu_dtype = config['MAIN']['permutation dtype']
 
-        max_iterations = iterations
-
         problem_name = config['INSTANCE']['problem']
         instance_path = config['INSTANCE']['path']
-        size = int(config['INSTANCE']['size'])
 
-        db_path = config['DATA']['db path']
-        save_log = config['DATA']['save log'] == 'True'
-        plot = config['DATA']['plot'] == 'True'
-        
+        islands = config.getint('ISLANDS', 'islands', fallback=1)
+        topology = config.get('ISLANDS', 'topology', fallback='ring')
+        migration_interval = config.getint('ISLANDS', 'migration interval', fallback=10)
+        migrants = config.getint('ISLANDS', 'migrants', fallback=2)
+
         # Dtype
         if permu_dtype == 'int8':
             permu_dtype = np.int8
@@ -123,101 +213,213 @@ class DBMan():
             permu_dtype = np.int32
 
         # Problem
-        if  problem_name == 'QAP':
-            problem = problems.QAP() # Init problem
-            dist, flow = problem.load_instance(instance_path) # Read instance
+        if problem_name not in ('QAP', 'PFSP'):
+            print('Problem ', problem_name, ' found in ', 
+                  self.config_f, ' is not a valid problem name')
+            quit()
+
+        # Sampling function
+        if umda.get_sampling_func(sampling) is None:
+            print('Error! ', sampling, ' was not found.')
+            quit()
 
-            def evaluator(permu):
-                return problem.evaluate(permu, dist, flow) 
+        if umda.sampling_spaces[sampling] != space:
+            print('[!] Skipping ', space, ' space with ', sampling, ' sampling: ', sampling, 
+                  ' only works in the ', umda.sampling_spaces[sampling], ' space.')
+            return None
+
+        return {'problem': problem_name,
+                'instance': instance_path,
+                'pop size': pop_size,
+                'survivor rate': surv_rate,
+                'iterations': iterations,
+                'space': space,
+                'sampling': sampling,
+                'timeout': timeout,
+                'check repeat': check_repeat,
+                'permutation dtype': permu_dtype,
+                'islands': islands,
+                'topology': topology,
+                'migration interval': migration_interval,
+                'migrants': migrants}
+
+    def _job_id(self, config, repetition):
+        '''Deterministic identifier of a job, built from its configuration and
+        repetition number, so that finished jobs can be found in the main logger.
+        '''
+        items = [(section, key, value) 
+                 for section in config.sections() 
+                 for key, value in config[section].items()
+                 if key not in ('repetitions', 'workers')]
 
-        elif problem_name == 'PFSP':
-            problem = problems.PFSP() # Init problem
-            instance = problem.load_instance(instance_path) # Read instance
+        return str(uuid.uuid5(uuid.NAMESPACE_OID, repr(sorted(items)) + str(repetition)))
 
-            def evaluator(permu):
-                # NOTE: Set makespan True to optimize PFSP makespan, else TFT will be evaluated
-                return problem.evaluate(permu, instance, makespan=False) 
+    def _done_jobs(self, db_path, store=None):
+        '''Identifiers of the runs found in the result store, or in the main 
+        logger of the given path if there is no store.
+        '''
+        if store is not None:
+            return store.run_ids()
 
-        else:
-            print('Problem ', problem, ' found in ', 
-                  self.config_f, ' is not a valid problem name')
+        try:
+            with open(db_path+'main.csv', 'r') as csvfile:
+                # The id is the first field, the header (if any) is ignored
+                return set(row[0] for row in csv.reader(csvfile) if row)
 
-        # Sampling function
-        if sampling == 'ad-hoc-laplace':
-            sampling_func = umda.sample_ad_hoc_laplace
+        except FileNotFoundError:
+            return set()
 
-        elif sampling == 'ad-hoc-laplace-random':
-            sampling_func = umda.sample_ad_hoc_laplace_random
+    def run_experiment(self):
+        '''Runs the experiment of the configuration file. List-valued keys 
+        (Ex.: search space = permutation, vj) are expanded into a job for each 
+        combination of values and repetition. Jobs found in the main logger 
+        are skipped, so an interrupted experiment can be resumed, or the 
+        failed jobs run again.
+        '''
+        config = self._read_config()
 
-        elif sampling == 'no-restriction':
-            sampling_func = umda.sample_no_restriction
+        print('[*] Config file read succsessfully.')
+        
+        repetitions = int(config['MAIN']['repetitions'])
+        workers = config.getint('MAIN', 'workers', fallback=1)
 
-        elif sampling == 'no-restriction-random':
-            sampling_func = umda.sample_no_restriction_random
+        db_path = config['DATA']['db path']
+        save_log = config['DATA']['save log'] == 'True'
+        plot = config['DATA']['plot'] == 'True'
+        sink = config.get('DATA', 'sink', fallback='sqlite')
 
-        else:
-            print('Error! ', sampling_func, ' was not found.')
+        if sink not in ('sqlite', 'csv'):
+            print('Error! ', sink, ' is not a valid sink, use sqlite or csv.')
             quit()
 
-        # Repetitions loop 
-        for repetition in range(repetitions):
+        store = None
+        if save_log and sink == 'sqlite':
+            store = ResultStore(db_path+self.store_name)
 
-            algorithm_id = str(uuid.uuid4())
+        jobs = []
+        for job_config in self._expand_config(config):
+            params = self._job_params(job_config)
+            if params is None:
+                continue
 
-            alg = Algorithm(size=size,
-                            pop_size=pop_size,
-                            evaluator=evaluator,
-                            surv_rate=surv_rate,
-                            iters=iterations,
-                            space=space,
-                            sampling_func=sampling_func,
-                            timeout=timeout,
-                            check_repeat=check_repeat,
-                            permu_dtype=permu_dtype)
+            params['verbose'] = workers <= 1 # Do not mix the output of the workers 
 
-            log = alg.run()
-            
-            if save_log:
+            for repetition in range(repetitions):
+                jobs.append((self._job_id(job_config, repetition), params))
+
+        done = self._done_jobs(db_path, store) if save_log else set()
+        n_jobs = len(jobs)
+        jobs = [job for job in jobs if job[0] not in done]
+
+        print('[*] Jobs to run: ', len(jobs), ', already done: ', n_jobs-len(jobs))
+
+        # Independent random stream for each job (a repetition of a 
+        # configuration), derived from its identifier, so that a job gives 
+        # the same results when it is run again
+        seeds = [np.random.SeedSequence(uuid.UUID(job_id).int) for job_id, _ in jobs]
+
+        # A failed job is not saved, the rest of the jobs keep running
+        failed = 0
+
+        if workers > 1:
+            # Jobs run concurrently, the results are saved by this process 
+            # as they arrive, so there is a single writer
+            with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+                futures = {executor.submit(_run_repetition, params, seed): (job_id, params) 
+                           for (job_id, params), seed in zip(jobs, seeds)}
+
+                for future in concurrent.futures.as_completed(futures):
+                    job_id, params = futures[future]
+                    try:
+                        log = future.result()
+                    except Exception as e:
+                        print('[!] Job ', job_id, ' failed: ', repr(e))
+                        failed += 1
+                        continue
+
+                    self._save_run(log, job_id, params, db_path, save_log, plot, store)
+
+        else:
+            # Jobs loop 
+            for (job_id, params), seed in zip(jobs, seeds):
+                try:
+                    log = _run_repetition(params, seed)
+                except Exception as e:
+                    print('[!] Job ', job_id, ' failed: ', repr(e))
+                    failed += 1
+                    continue
+
+                self._save_run(log, job_id, params, db_path, save_log, plot, store)
+
+        if failed > 0:
+            print('[!] ', failed, ' jobs failed, they are run again if the experiment is resumed.')
+
+        if store is not None:
+            store.close()
+
+    def _save_run(self, log, algorithm_id, params, db_path, save_log, plot, store=None):
+        '''Saves the log of a run and appends it to the main logger.
+
+        Args:
+            log (dict): Log returned by the algorithm.
+            algorithm_id (str): Identifier of the run.
+            params (dict): Parameters of the run.
+            db_path (str): Path of the logs.
+            save_log (bool): If false, nothing is saved.
+            plot (bool): If true, the log is plotted.
+            store (ResultStore or None): Store to save the run in, if None the
+                                         log is saved as a CSV file and appended
+                                         to the main logger. Default: None.
+        '''
+        iters = len(log['min'])
+
+        if save_log:
+
+            main_log = {
+                'id':algorithm_id,
+                'date': str(datetime.datetime.now()),
+                'problem name': params['problem'],
+                'instance': params['instance'],
+                'max iterations': params['iterations'],
+                'iterations': iters,
+                'space': params['space'],
+                'sampling': params['sampling'],
+                'pop size': params['pop size'],
+                'check repeat': params['check repeat'],
+                'min': log['min'][-1]}
+
+            if store is not None:
+                store.add_run(main_log, log)
+
+            else:
+                import pandas as pd
 
                 data = pd.DataFrame.from_dict(log)
                 data.to_csv(db_path+algorithm_id)
 
-                iters = len(log['min'])
-
-                main_log = {
-                    'id':algorithm_id,
-                    'date': str(datetime.datetime.now()),
-                    'problem name': problem_name,
-                    'instance': instance_path,
-                    'max iterations':iterations,
-                    'iterations': iters,
-                    'space':space,
-                    'sampling':sampling,
-                    'pop size': pop_size,
-                    'check repeat': check_repeat,
-                    'min': log['min'][-1]}
-                
                 try:
                     csvfile = open(db_path+'main.csv', 'a')
-                    
+                
                 except:
                     print('The main log was not found in '+db_path+' creating a new one.')
                     self.generate_main_log()
 
                     csvfile = open(db_path+'main.csv', 'a')
-                
+            
                 writer = csv.DictWriter(csvfile, 
                                         fieldnames=self.main_log_fields)
                 writer.writerow(main_log)
 
                 csvfile.close()
 
-            if plot:
-                plt.plot(range(iters), log['min'], label='min')
-                plt.plot(range(iters), log['max'], label='max')
-                plt.plot(range(iters), log['median'], label='median')
-                plt.legend()
-                plt.show()
+        if plot:
+            import matplotlib.pyplot as plt
+
+            plt.plot(range(iters), log['min'], label='min')
+            plt.plot(range(iters), log['max'], label='max')
+            plt.plot(range(iters), log['median'], label='median')
+            plt.legend()
+            plt.show()
 
     def generate_main_log(self):
         ok = False
@@ -233,79 +435,116 @@ class DBMan():
             writer.writeheader()
 
 
-    def plot_main(self):
+    def _load_results(self, path, hue):
+        '''Loads the traces of every run of the given path from the CSV files 
+        of the main logger.
 
-        import seaborn as sns
+        Args:
+            path (str): Path of the logs.
+            hue (str): Field of the main log added to each row ('space' or 'sampling').
+
+        Returns:
+            tuple(DataFrame, str): The traces, with the iteration and hue columns,
+                and the instance of the first run.
+        '''
+        import pandas as pd
 
-        path = input('Please enter the path for the main logger >')
-        
         main = pd.read_csv(path+'main.csv')
 
         ids = list(main['id'])
 
         instance = list(main['instance'])[0]
-        # print(ids)
 
         frames = []
         for id_ in ids:
             data = pd.read_csv(path+id_)
 
-            space = str(list(main.loc[main['id']==id_]['space'])[0])
+            value = str(list(main.loc[main['id']==id_][hue])[0])
             iters = list(range(len(data)))
 
-            data = data.assign(space = space) 
+            data = data.assign(**{hue: value}) 
             data = data.assign(iteration = iters) 
 
             frames.append(data)
         
-        results = pd.concat(frames)
+        return pd.concat(frames), instance
 
-        sns.set(style="darkgrid")
+    def _plot_results(self, path, hue):
+        '''Plots the min of the runs of the given path in each iteration, a 
+        line for each value of hue ('space' or 'sampling'). If there is a 
+        result store, the median and quartiles of its aggregates are plotted, 
+        else every CSV file of the main logger is loaded.
+        '''
+        import pandas as pd
+        import matplotlib.pyplot as plt
 
-        sns.lineplot(x='iteration', y='min',
-             hue="space", 
-             data=results)
+        if not os.path.exists(path+self.store_name):
+            import seaborn as sns
 
-        plt.title(instance)
-        plt.show()
+            results, instance = self._load_results(path, hue)
 
-    def plot_main_2(self):
+            sns.set(style="darkgrid")
 
-        import seaborn as sns
+            sns.lineplot(x='iteration', y='min',
+                 hue=hue, 
+                 data=results)
 
-        path = input('Please enter the path for the main logger >')
-        
-        main = pd.read_csv(path+'main.csv')
+            plt.title(instance)
+            plt.show()
+            return
 
-        ids = list(main['id'])
+        with ResultStore(path+self.store_name) as store:
+            aggregates = pd.DataFrame(store.aggregates())
 
-        instance = list(main['instance'])[0]
-        # print(ids)
+        instance = aggregates['instance'].iloc[0]
+        aggregates = aggregates[aggregates['instance'] == instance]
 
-        frames = []
-        for id_ in ids:
-            data = pd.read_csv(path+id_)
+        other = 'sampling' if hue == 'space' else 'space'
+        single = aggregates[other].nunique() == 1
 
-            sampling = str(list(main.loc[main['id']==id_]['sampling'])[0])
-            iters = list(range(len(data)))
+        for (value, other_value), group in aggregates.groupby([hue, other]):
+            label = value if single else value+' ('+other_value+')'
 
-            data = data.assign(sampling = sampling) 
-            data = data.assign(iteration = iters) 
+            plt.plot(group['iteration'], group['median'], label=label)
+            plt.fill_between(group['iteration'], group['q25'], group['q75'], alpha=.3)
 
-            frames.append(data)
+        plt.xlabel('iteration')
+        plt.ylabel('min')
+        plt.legend(title=hue)
+        plt.title(instance)
+        plt.show()
+
+    def plot_main(self):
+
+        path = input('Please enter the path for the main logger >')
         
-        results = pd.concat(frames)
+        self._plot_results(path, 'space')
 
-        sns.set(style="darkgrid")
+    def plot_main_2(self):
 
-        sns.lineplot(x='iteration', y='min',
-             hue="sampling", 
-             data=results)
+        path = input('Please enter the path for the main logger >')
+        
+        self._plot_results(path, 'sampling')
 
-        plt.title(instance)
-        plt.show()
+    def summary(self, path):
+        '''Summary table of the result store of the given path, the 
+        statistics of the min of the runs of each instance, search space and 
+        sampling in their last iteration.
+
+        Args:
+            path (str): Path of the result store.
+
+        Returns:
+            DataFrame: A row for each instance, search space and sampling.
+        '''
+        import pandas as pd
+
+        with ResultStore(path+self.store_name) as store:
+            return pd.DataFrame(store.aggregates(last=True))
 
     def plot_experiment(self, path):
+        import pandas as pd
+        import matplotlib.pyplot as plt
 
         data = pd.read_csv(path)
         iters = list(range(len(data)))
@@ -327,6 +566,7 @@ if __name__ == '__main__':
     print('[3] Run experiment from config.')
     print('[4] Plot main results.')
     print('[5] Plot experiment result.')
+    print('[6] Summary of the results.')
 
     print('\n[0] Exit.') 
 
@@ -350,5 +590,9 @@ if __name__ == '__main__':
         path = input('[*] Path and name of the experiment to plot >')
         dbman.plot_experiment(path)
 
+    elif sel == 6:
+        path = input('Please enter the path for the result store >')
+        print(dbman.summary(path).to_string(index=False))
+
     elif sel == 0:
         quit()
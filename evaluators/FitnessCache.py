@@ -0,0 +1,107 @@
+import collections
+import numpy as np
+
+class FitnessCache():
+
+    def __init__(self, evaluator, maxsize=100000, batch_evaluator=None, 
+                 dtype=np.int16):
+        '''Bounded fitness cache with LRU eviction, wraps an evaluation function.
+
+        Args:
+            evaluator (func): Evaluation function, is given a permutation and 
+                              returns its fitness value.
+            maxsize (int): Maximum number of cached fitness values. Default: 100000.
+            batch_evaluator (func or None): Evaluation function that is given a 
+                              matrix of permutations and returns an array with 
+                              their fitness values, used for the cache misses of 
+                              evaluate_batch. Default: None.
+            dtype: numpy type used to build the keys of the permutations, 
+                   must hold the largest element. Default: np.int16.
+
+        Returns:
+            FitnessCache instance.
+        '''
+        self.evaluator = evaluator
+        self.batch_evaluator = batch_evaluator
+        self.maxsize = maxsize
+        self.dtype = dtype
+
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, permu):
+        '''Compact key of the given permutation, its bytes.
+        '''
+        return np.asarray(permu, dtype=self.dtype).tobytes()
+
+    def _get(self, key):
+        f = self.cache.get(key)
+        if f is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+        return f
+
+    def _put(self, key, f):
+        self.cache[key] = f
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+
+    def __call__(self, permu):
+        '''Returns the fitness value of the given permutation, evaluating it 
+        only if it is not cached.
+        '''
+        key = self.key(permu)
+        f = self._get(key)
+        if f is None:
+            self.misses += 1
+            f = self.evaluator(permu)
+            self._put(key, f)
+        return f
+
+    def evaluate_batch(self, pop):
+        '''Returns the fitness values of every permutation of the population. 
+        The permutations that are not cached are evaluated together, once even
+        if they are repeated in the population.
+
+        Args:
+            pop (ndarray): Population matrix.
+
+        Returns:
+            ndarray: Fitness values of the given population.
+        '''
+        fitness = np.empty(len(pop))
+        missing = collections.OrderedDict() # key -> rows of the population
+
+        for i, permu in enumerate(pop):
+            key = self.key(permu)
+            f = self._get(key)
+            if f is not None:
+                fitness[i] = f
+            elif key in missing:
+                self.hits += 1
+                missing[key].append(i)
+            else:
+                missing[key] = [i]
+
+        if len(missing) > 0:
+            first_rows = [rows[0] for rows in missing.values()]
+
+            if self.batch_evaluator is not None:
+                values = self.batch_evaluator(np.asarray(pop)[first_rows])
+            else:
+                values = [self.evaluator(pop[i]) for i in first_rows]
+
+            for (key, rows), f in zip(missing.items(), values):
+                self.misses += 1
+                fitness[rows] = f
+                self._put(key, f)
+
+        return fitness
+
+    def clear(self):
+        '''Removes every cached value and resets the counters.
+        '''
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
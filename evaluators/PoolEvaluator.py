@@ -0,0 +1,158 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+# State of each worker process, set by _init_worker
+_worker = {}
+
+def _init_worker(func, arrays, result_index):
+    '''Initializer of the worker processes, attaches the shared instance arrays.
+    '''
+    _worker['func'] = func
+    _worker['result_index'] = result_index
+    _worker['shm'] = {}
+    _worker['args'] = [_attach(name, shape, dtype) for name, shape, dtype in arrays]
+
+def _attach(name, shape, dtype):
+    '''Numpy view of the shared memory block with the given name.
+    '''
+    if name not in _worker['shm']:
+        _worker['shm'][name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=dtype, buffer=_worker['shm'][name].buf)
+
+def _evaluate_range(task):
+    '''Evaluates the rows [start, stop) of the shared samples buffer and 
+    writes the fitness values in the shared output buffer.
+    '''
+    in_name, out_name, shape, dtype, start, stop = task
+
+    pop = _attach(in_name, shape, dtype)
+    out = _attach(out_name, (shape[0],), np.float64)
+
+    f = _worker['func'](pop[start:stop], *_worker['args'])
+    if _worker['result_index'] is not None:
+        f = f[_worker['result_index']]
+
+    out[start:stop] = f
+
+def _share(array):
+    '''Copies the array to a new shared memory block.
+    '''
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm
+
+class PoolEvaluator():
+
+    def __init__(self, func, arrays, n_workers=None, result_index=None, 
+                 chunks_per_worker=1):
+        '''Evaluates populations in a persistent pool of processes. The 
+        instance arrays and the populations to evaluate are kept in shared 
+        memory, so only index ranges are sent to the workers.
+
+        Args:
+            func (func): Batch evaluation function, is given a matrix of 
+                         permutations followed by the instance arrays and returns 
+                         an array with their fitness values 
+                         (Ex.: problems.QAP().evaluate_batch). Must be picklable.
+            arrays (list): Instance arrays (Ex.: [distance_matrix, flow_matrix]).
+            n_workers (int or None): Number of worker processes, if None the 
+                                     number of CPUs. Default: None.
+            result_index (int or None): If func returns a tuple, the index of the 
+                                        fitness values in it. Default: None.
+            chunks_per_worker (int): Number of index ranges each population is 
+                                     split into per worker. Default: 1.
+
+        Returns:
+            PoolEvaluator instance.
+        '''
+        self.n_workers = n_workers if n_workers is not None else mp.cpu_count()
+        self.chunks_per_worker = chunks_per_worker
+
+        self._instance_shm = []
+        arrays_spec = []
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            shm = _share(array)
+            self._instance_shm.append(shm)
+            arrays_spec.append((shm.name, array.shape, array.dtype.str))
+
+        # Samples and fitness buffers, allocated on the first call
+        self._in_shm = None
+        self._out_shm = None
+        self._buffer_spec = None
+
+        self.pool = mp.Pool(self.n_workers, 
+                            initializer=_init_worker, 
+                            initargs=(func, arrays_spec, result_index))
+
+    def _ensure_buffers(self, shape, dtype):
+        '''Allocates the shared buffers if the current ones can not hold a 
+        population of the given shape and dtype.
+        '''
+        spec = (shape[1], dtype.str)
+        if (self._in_shm is not None and self._buffer_spec[0] == spec 
+                and self._buffer_spec[1] >= shape[0]):
+            return
+
+        self._free_buffers()
+
+        n_rows = shape[0]
+        self._in_shm = shared_memory.SharedMemory(create=True, 
+                                                  size=max(1, n_rows*shape[1]*dtype.itemsize))
+        self._out_shm = shared_memory.SharedMemory(create=True, size=max(1, n_rows*8))
+        self._buffer_spec = (spec, n_rows)
+
+    def _free_buffers(self):
+        for shm in (self._in_shm, self._out_shm):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._in_shm = None
+        self._out_shm = None
+
+    def __call__(self, pop):
+        '''Evaluates every permutation of the given population.
+
+        Args:
+            pop (ndarray): Population matrix.
+
+        Returns:
+            ndarray: Fitness values of the given population.
+        '''
+        pop = np.ascontiguousarray(pop)
+        self._ensure_buffers(pop.shape, pop.dtype)
+
+        capacity = self._buffer_spec[1]
+        shape = (capacity, pop.shape[1])
+
+        in_buf = np.ndarray(shape, dtype=pop.dtype, buffer=self._in_shm.buf)
+        out_buf = np.ndarray((capacity,), dtype=np.float64, buffer=self._out_shm.buf)
+        in_buf[:len(pop)] = pop
+
+        n_chunks = max(1, min(len(pop), self.n_workers*self.chunks_per_worker))
+        bounds = np.linspace(0, len(pop), n_chunks+1).astype(int)
+
+        tasks = [(self._in_shm.name, self._out_shm.name, shape, pop.dtype.str, start, stop)
+                 for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        self.pool.map(_evaluate_range, tasks)
+
+        return out_buf[:len(pop)].copy()
+
+    def close(self):
+        '''Stops the worker processes and frees the shared memory.
+        '''
+        self.pool.close()
+        self.pool.join()
+
+        self._free_buffers()
+        for shm in self._instance_shm:
+            shm.close()
+            shm.unlink()
+        self._instance_shm = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
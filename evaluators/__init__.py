@@ -0,0 +1,2 @@
+from evaluators.FitnessCache import FitnessCache
+from evaluators.PoolEvaluator import PoolEvaluator
@@ -0,0 +1,222 @@
+import multiprocessing as mp
+import numpy as np
+
+import problems
+from optimizers import UMDA, LocalSearch
+
+from algorithm import Algorithm
+
+class Migration():
+
+    def __init__(self, island_id, interval, n_migrants, targets, n_sources, inboxes):
+        '''Migration of one island, exchanges solutions through queues.
+
+        Args:
+            island_id (int): Identifier of the island.
+            interval (int): Number of generations between migrations.
+            n_migrants (int): Number of solutions sent to each target island.
+            targets (list): Identifiers of the islands the solutions are sent to.
+            n_sources (int): Number of islands that send solutions to this one.
+            inboxes (list): Queue of each island, the received messages.
+
+        Returns:
+            Migration instance.
+        '''
+        self.island_id = island_id
+        self.interval = interval
+        self.n_migrants = n_migrants
+        self.targets = targets
+        self.n_sources = n_sources
+        self.inboxes = inboxes
+
+        self.epoch = 0
+        self.pending = [] # Messages of future migrations
+
+    def exchange(self, emigrants, emigrants_f):
+        '''Sends the emigrants to the target islands and waits for the
+        solutions of the source islands of the same migration.
+
+        Args:
+            emigrants (ndarray): Matrix of solutions to send.
+            emigrants_f (ndarray): Fitness array of the solutions to send.
+
+        Returns:
+            tuple(ndarray, ndarray): The received solutions and their fitness.
+        '''
+        for target in self.targets:
+            self.inboxes[target].put((self.epoch, emigrants, emigrants_f))
+
+        received = [m for m in self.pending if m[0] == self.epoch]
+        self.pending = [m for m in self.pending if m[0] != self.epoch]
+
+        while len(received) < self.n_sources:
+            message = self.inboxes[self.island_id].get()
+            if message[0] == self.epoch:
+                received.append(message)
+            else:
+                self.pending.append(message)
+
+        self.epoch += 1
+
+        if len(received) == 0:
+            return emigrants[:0], emigrants_f[:0]
+
+        immigrants = np.concatenate([m[1] for m in received])
+        immigrants_f = np.concatenate([m[2] for m in received])
+
+        return immigrants, immigrants_f
+
+def topology_targets(topology, n_islands):
+    '''Islands each island sends its solutions to.
+
+    Args:
+        topology (str): 'ring' (island i sends to i+1) or 'full' (every island
+                        sends to every other island).
+        n_islands (int): Number of islands.
+
+    Returns:
+        list: list of target islands of each island.
+
+    Raises:
+        ValueError: If the topology is not valid.
+    '''
+    if topology == 'ring':
+        return [[(i+1) % n_islands] if n_islands > 1 else [] for i in range(n_islands)]
+
+    elif topology == 'full':
+        return [[j for j in range(n_islands) if j != i] for i in range(n_islands)]
+
+    raise ValueError('Topology ' + str(topology) + ' is not a valid topology.')
+
+def _run_island(island_id, params, migration, results, seed):
+    '''Process of an island, builds and runs its algorithm.
+    '''
+    try:
+        umda = UMDA()
+        problem = problems.load_problem(params['problem'], params['instance'])
+
+        local_search = None
+        if params['local search'] is not None:
+            local_search = LocalSearch(problem['neighbourhood'],
+                                       first_improvement=params['local search'] == 'first')
+
+        alg = Algorithm(size=problem['size'],
+                        pop_size=params['pop size'],
+                        evaluator=problem['evaluator'],
+                        surv_rate=params['survivor rate'],
+                        iters=params['iterations'],
+                        space=params['space'],
+                        sampling_func=umda.get_sampling_func(params['sampling']),
+                        timeout=params['timeout'],
+                        check_repeat=params['check repeat'],
+                        permu_dtype=params['permutation dtype'],
+                        batch_evaluator=problem['batch_evaluator'],
+                        local_search=local_search,
+                        local_search_target=params['local search target'],
+                        cache_size=params['cache size'],
+                        migration=migration,
+                        rng=np.random.default_rng(seed))
+
+        results.put((island_id, alg.run(verbose=False), None))
+
+    except Exception as e:
+        results.put((island_id, None, repr(e)))
+
+class IslandModel():
+
+    def __init__(self,
+                 params,
+                 n_islands,
+                 topology='ring',
+                 interval=10,
+                 n_migrants=2,
+                 seed=None):
+        '''Island model, runs an Algorithm in a process for each island and
+        periodically exchanges the best solutions between them.
+
+        Args:
+            params (dict): Parameters of the algorithm of each island, with the
+                           keys: 'problem', 'instance', 'pop size', 'survivor rate',
+                           'iterations', 'space', 'sampling', 'timeout',
+                           'check repeat' and 'permutation dtype'; and optionally
+                           'local search', 'local search target' and 'cache size'.
+            n_islands (int): Number of islands.
+            topology (str): Migration topology, 'ring' or 'full'. Default: 'ring'.
+            interval (int): Number of generations between migrations. Default: 10.
+            n_migrants (int): Number of solutions sent to each target island.
+                              Default: 2.
+            seed (int, numpy.random.SeedSequence or None): Seed of the model,
+                              each island runs with an independent stream
+                              spawned from it, the same in every run.
+                              Default: None, a seed given by the system.
+
+        Returns:
+            IslandModel instance.
+        '''
+        self.params = {'local search': None,
+                       'local search target': 'samples',
+                       'cache size': None}
+        self.params.update(params)
+
+        self.n_islands = n_islands
+        self.targets = topology_targets(topology, n_islands)
+        self.interval = interval
+        self.n_migrants = n_migrants
+
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+
+        # Independent random stream of each island
+        self.seeds = seed.spawn(n_islands)
+
+    def run(self):
+        '''Runs every island until the iterations of the algorithm are done.
+
+        Returns:
+            tuple(dict, list): The log of the model, with the 'min', 'max',
+                'mean' and 'median' of the islands in each generation (the median
+                is the median of the medians of the islands) and the sum of their
+                times and counters (Algorithm.stats_keys), and the log of each 
+                island.
+
+        Raises:
+            RuntimeError: If an island fails.
+        '''
+        inboxes = [mp.Queue() for _ in range(self.n_islands)]
+        results = mp.Queue()
+
+        processes = []
+        for i in range(self.n_islands):
+            n_sources = sum(i in targets for targets in self.targets)
+            migration = Migration(i, self.interval, self.n_migrants,
+                                  self.targets[i], n_sources, inboxes)
+
+            process = mp.Process(target=_run_island,
+                                 args=(i, self.params, migration, results, self.seeds[i]))
+            process.start()
+            processes.append(process)
+
+        logs = [None]*self.n_islands
+        try:
+            for _ in range(self.n_islands):
+                island_id, log, error = results.get()
+                if error is not None:
+                    raise RuntimeError('Island ' + str(island_id) + ' failed: ' + error)
+                logs[island_id] = log
+
+        finally:
+            for island_id, process in enumerate(processes):
+                if logs[island_id] is None:
+                    process.terminate()
+                process.join()
+
+        log = {'min': list(np.min([l['min'] for l in logs], axis=0)),
+               'max': list(np.max([l['max'] for l in logs], axis=0)),
+               'mean': list(np.mean([l['mean'] for l in logs], axis=0)),
+               'median': list(np.median([l['median'] for l in logs], axis=0))}
+
+        # Times and counters of the islands are added up
+        for key in Algorithm.stats_keys:
+            log[key] = list(np.sum([l[key] for l in logs], axis=0))
+
+        return log, logs
@@ -1,129 +1,387 @@
 import sys
 import csv
+import json
 import argparse
 import numpy as np
 import datetime
+import concurrent.futures
 
 # import pandas as pd
 
 from algorithm import Algorithm
-from optimizers import UMDA
+from optimizers import UMDA, LocalSearch
 import problems
+from evaluators import PoolEvaluator
+from islands import IslandModel
+from resultstore import ResultStore
 
 
 umda = UMDA()
 
-# Parse arguments
-parser = argparse.ArgumentParser(description='UMDA Launcher')
-
-parser.add_argument('-id', help='Identifier', type=int)
-parser.add_argument('-i', '--iters', help='Iterations', type=int)
-parser.add_argument('-Pn', '--problem', help='Name of the problem', type=str)
-parser.add_argument('-Pp', '--instance', help='Path of the instance to solve', type=str)
-parser.add_argument('-Ps', '--pop-size', help='Population size', type=int, default=200)
-parser.add_argument('-Sr', '--srate', help='Survivor rate', type=float, default=.5)
-parser.add_argument('-s', '--space', help='Search space to work with', type=str)
-parser.add_argument('-Sf', '--sampling-func', help='Sampling function to use', type=str)
-parser.add_argument('-c', '--check-repeat', help='Enable check repeat', type=bool, default=True)
-parser.add_argument('-d', '--dtype', help='Permutation dtype', type=str, default='int8')
-parser.add_argument('-t', '--timeout', help='Timeout sampling', type=int, default=5000)
-parser.add_argument('-o', '--out', help='Output file path', type=str)
-parser.add_argument('-m', '--main-out', help='Main logger file path, including file name', type=str)
-parser.add_argument('-v', '--verbose', help='If enabled, basic info of each iter is printed', 
-                    type=str, default=False)
-
-args = parser.parse_args()
-
-# Define problem
-if args.problem == 'QAP':
-    problem = problems.QAP() # Init problem
-    dist, flow = problem.load_instance(args.instance) # Read instance
-
-    size = dist.shape[0]
-
-    def evaluator(permu):
-        return problem.evaluate(permu, dist, flow) 
-
-elif args.problem == 'PFSP':
-    problem = problems.PFSP() # Init problem
-    instance = problem.load_instance(args.instance) # Read instance
-
-    size = instance.shape[1]
-
-    def evaluator(permu):
-        # NOTE: Set makespan True to optimize PFSP makespan, else TFT will be evaluated
-        return problem.evaluate(permu, instance, makespan=False) 
-
-# Define permutation dtype
-if args.dtype == 'int8':
-    dtype = np.int8
-
-elif args.dtype == 'int16':
-    dtype = np.int16
-
-elif args.dtype == 'int32':
-    dtype = np.int32
-
-# Sampling function
-if args.sampling_func == 'ad-hoc-laplace':
-    sampling_func = umda.sample_ad_hoc_laplace
-
-if args.sampling_func == 'ad-hoc-laplace-random':
-    sampling_func = umda.sample_ad_hoc_laplace_random
-
-elif args.sampling_func == 'no-restriction':
-    sampling_func = umda.sample_no_restriction
-
-elif args.sampling_func == 'no-restriction-random':
-    sampling_func = umda.sample_no_restriction_random
-
-else:
-    print('Error! ', args.sampling_func, ' sampling function was not found.')
-    quit()
-
-# Init algorithm
-alg = Algorithm(size=size,
-                pop_size=args.pop_size,
-                evaluator=evaluator,
-                surv_rate=args.srate,
-                iters=args.iters,
-                space=args.space,
-                sampling_func=sampling_func,
-                timeout=args.timeout,
-                check_repeat=args.check_repeat,
-                permu_dtype=dtype)
-
-log = alg.run(args.verbose)
-
-# Write experiment data to logger
-with open(args.out+str(args.id)+'.csv', 'w') as f:  # Just use 'w' mode in 3.x
-
-    w = csv.DictWriter(f, log.keys())
-    w.writeheader()
-
-    for i in range(len(log['min'])):
-        w.writerow({'min':log['min'][i],
-                    'max':log['max'][i],
-                    'mean':log['mean'][i],
-                    'median':log['median'][i]})
-
-# data = pd.DataFrame.from_dict(log)
-# data.to_csv(args.out+str(args.id)+'.csv')
-
-# Append to main logger
-main_log = {
-    'id':args.id,
-    'date': str(datetime.datetime.now()),
-    'problem name': args.problem,
-    'instance': args.instance,
-    'max iterations': args.iters,
-    'iterations': len(log['min']),
-    'space': args.space,
-    'sampling': args.sampling_func,
-    'pop size': args.pop_size,
-    'check repeat': args.check_repeat,
-    'min':log['min'][-1]}
-
-with open(args.main_out, 'a') as f:
-    w = csv.DictWriter(f, main_log.keys())
-    w.writerow(main_log)
+# Problems loaded by this process, reused by the jobs of a batch
+_problems = {}
+
+def str_to_bool(value):
+    '''Parses a boolean option, bool('False') would be True.
+
+    Args:
+        value (str): 'true', '1' or 'yes' (any case) for True, else False.
+
+    Returns:
+        bool: Value of the option.
+    '''
+    return value.strip().lower() in ('true', '1', 'yes')
+
+def build_parser():
+    '''Parser of the arguments of the launcher, each job of a batch uses the
+    same options.
+    '''
+    parser = argparse.ArgumentParser(description='UMDA Launcher')
+
+    parser.add_argument('-id', help='Identifier', type=int)
+    parser.add_argument('-i', '--iters', help='Iterations', type=int)
+    parser.add_argument('-Pn', '--problem', help='Name of the problem', type=str)
+    parser.add_argument('-Pp', '--instance', help='Path of the instance to solve', type=str)
+    parser.add_argument('-Ps', '--pop-size', help='Population size', type=int, default=200)
+    parser.add_argument('-Sr', '--srate', help='Survivor rate', type=float, default=.5)
+    parser.add_argument('-s', '--space', help='Search space to work with', type=str)
+    parser.add_argument('-Sf', '--sampling-func', help='Sampling function to use', type=str)
+    parser.add_argument('-c', '--check-repeat', help='Enable check repeat', type=str_to_bool, default=True)
+    parser.add_argument('-d', '--dtype', help='Permutation dtype', type=str, default='int8')
+    parser.add_argument('-t', '--timeout', help='Timeout sampling', type=int, default=5000)
+    parser.add_argument('-o', '--out', help='Output file path', type=str)
+    parser.add_argument('-m', '--main-out', help='Main logger file path, including file name', type=str)
+    parser.add_argument('-S', '--sink', help='Where the results are saved: sqlite (result store) or csv',
+                        type=str, default='sqlite')
+    parser.add_argument('-db', '--store', help='Path of the result store, by default results.db in the output path',
+                        type=str, default=None)
+    parser.add_argument('-ls', '--local-search', help='Local search strategy: first or best improvement',
+                        type=str, default=None)
+    parser.add_argument('-lt', '--ls-target', help='Apply the local search to samples or survivors',
+                        type=str, default='samples')
+    parser.add_argument('-cs', '--cache-size', help='Size of the fitness cache, disabled by default',
+                        type=int, default=None)
+    parser.add_argument('-w', '--workers', help='Number of processes to evaluate the samples, disabled by default',
+                        type=int, default=None)
+    parser.add_argument('-I', '--islands', help='Number of islands of the island model',
+                        type=int, default=1)
+    parser.add_argument('-T', '--topology', help='Migration topology of the islands: ring or full',
+                        type=str, default='ring')
+    parser.add_argument('-Mi', '--migration-interval', help='Generations between migrations',
+                        type=int, default=10)
+    parser.add_argument('-Mn', '--migrants', help='Number of solutions sent in each migration',
+                        type=int, default=2)
+    parser.add_argument('-b', '--batch', help='File with a job per line (JSON lines or CSV with header), - for stdin. '
+                        'The options of each job override the ones of the command line',
+                        type=str, default=None)
+    parser.add_argument('-bw', '--batch-workers', help='Number of processes to run the jobs of the batch',
+                        type=int, default=None)
+    parser.add_argument('--seed', help='Seed of the random numbers, the runs with the same seed are the same. '
+                        'In batch mode each job runs with a stream spawned from its seed',
+                        type=int, default=None)
+    parser.add_argument('-v', '--verbose', help='If enabled, basic info of each iter is printed',
+                        type=str_to_bool, default=False)
+
+    return parser
+
+def load(problem_name, instance_path, workers=None):
+    '''Loads a problem instance and its evaluators, or returns the ones
+    already loaded by this process.
+
+    Args:
+        problem_name (str): Name of the problem, 'QAP' or 'PFSP'.
+        instance_path (str): Path of the instance file.
+        workers (int or None): If not None, the batch evaluator is a
+                               PoolEvaluator with this number of processes.
+
+    Returns:
+        dict: as returned by problems.load_problem.
+    '''
+    key = (problem_name, instance_path, workers)
+
+    if key not in _problems:
+        problem = problems.load_problem(problem_name, instance_path)
+
+        if workers is not None:
+            # NOTE: PFSP result_index 0 is the makespan, 1 the TFT
+            problem['batch_evaluator'] = PoolEvaluator(problem['problem'].evaluate_batch,
+                                                       problem['instance'],
+                                                       n_workers=workers,
+                                                       result_index=1 if problem_name == 'PFSP' else None)
+        _problems[key] = problem
+
+    return _problems[key]
+
+def close_problems():
+    '''Stops the evaluation processes of the loaded problems.
+    '''
+    for problem in _problems.values():
+        if isinstance(problem['batch_evaluator'], PoolEvaluator):
+            problem['batch_evaluator'].close()
+
+    _problems.clear()
+
+def check_job(args):
+    '''Checks the options of a job.
+
+    Args:
+        args (Namespace): Options of the job.
+
+    Returns:
+        str or None: Description of the first error, None if the job is valid.
+    '''
+    if args.problem not in ('QAP', 'PFSP'):
+        return str(args.problem) + ' is not a valid problem name.'
+
+    if args.dtype not in ('int8', 'int16', 'int32'):
+        return str(args.dtype) + ' is not a valid permutation dtype.'
+
+    if umda.get_sampling_func(args.sampling_func) is None:
+        return str(args.sampling_func) + ' sampling function was not found.'
+
+    if umda.sampling_spaces[args.sampling_func] != args.space:
+        return (str(args.sampling_func) + ' sampling only works in the ' 
+                + umda.sampling_spaces[args.sampling_func] + ' space.')
+
+    if args.local_search is not None and args.local_search not in ('first', 'best'):
+        return str(args.local_search) + ' local search strategy was not found.'
+
+    if args.sink not in ('sqlite', 'csv'):
+        return str(args.sink) + ' is not a valid sink, use sqlite or csv.'
+
+    # The islands evaluate in their own processes, see run_job
+    if args.workers is not None and args.islands > 1:
+        return 'The evaluation workers (-w) can not be used with the island model (-I > 1).'
+
+    return None
+
+def run_job(args, seed=None):
+    '''Runs the algorithm (or the island model) with the options of a job.
+
+    Args:
+        args (Namespace): Options of the job.
+        seed (int, numpy.random.SeedSequence or None): Seed of the random 
+                                stream of the job. Default: None, the seed 
+                                option of the job.
+
+    Returns:
+        dict: log of the algorithm.
+    '''
+    if seed is None:
+        seed = args.seed
+
+    dtype = {'int8': np.int8, 'int16': np.int16, 'int32': np.int32}[args.dtype]
+
+    if args.islands > 1:
+        # Init island model
+        params = {'problem': args.problem,
+                  'instance': args.instance,
+                  'pop size': args.pop_size,
+                  'survivor rate': args.srate,
+                  'iterations': args.iters,
+                  'space': args.space,
+                  'sampling': args.sampling_func,
+                  'timeout': args.timeout,
+                  'check repeat': args.check_repeat,
+                  'permutation dtype': dtype,
+                  'local search': args.local_search,
+                  'local search target': args.ls_target,
+                  'cache size': args.cache_size}
+
+        model = IslandModel(params,
+                            n_islands=args.islands,
+                            topology=args.topology,
+                            interval=args.migration_interval,
+                            n_migrants=args.migrants,
+                            seed=seed)
+
+        log, _ = model.run()
+        return log
+
+    # Evaluation processes are only used by the single population algorithm
+    problem = load(args.problem, args.instance, args.workers)
+
+    # Local search
+    local_search = None
+    if args.local_search is not None:
+        local_search = LocalSearch(problem['neighbourhood'],
+                                   first_improvement=args.local_search == 'first')
+
+    # Init algorithm
+    alg = Algorithm(size=problem['size'],
+                    pop_size=args.pop_size,
+                    evaluator=problem['evaluator'],
+                    surv_rate=args.srate,
+                    iters=args.iters,
+                    space=args.space,
+                    sampling_func=umda.get_sampling_func(args.sampling_func),
+                    timeout=args.timeout,
+                    check_repeat=args.check_repeat,
+                    permu_dtype=dtype,
+                    batch_evaluator=problem['batch_evaluator'],
+                    local_search=local_search,
+                    local_search_target=args.ls_target,
+                    cache_size=args.cache_size,
+                    rng=np.random.default_rng(seed))
+
+    log = alg.run(args.verbose)
+
+    if args.verbose and alg.cache is not None:
+        print('Fitness cache hits: ', alg.cache.hits, ' misses: ', alg.cache.misses)
+
+    return log
+
+def save_job(args, log):
+    '''Saves the log of a job, with its times and counters, in the result 
+    store, or in a CSV file and the main logger if the sink is csv.
+
+    Args:
+        args (Namespace): Options of the job.
+        log (dict): log of the algorithm.
+    '''
+    # Main logger data
+    main_log = {
+        'id':args.id,
+        'date': str(datetime.datetime.now()),
+        'problem name': args.problem,
+        'instance': args.instance,
+        'max iterations': args.iters,
+        'iterations': len(log['min']),
+        'space': args.space,
+        'sampling': args.sampling_func,
+        'pop size': args.pop_size,
+        'check repeat': args.check_repeat,
+        'min':log['min'][-1]}
+
+    if args.sink == 'sqlite':
+        store_path = args.store if args.store is not None else args.out+'results.db'
+
+        with ResultStore(store_path) as store:
+            store.add_run(main_log, log)
+
+    else:
+        # Write experiment data to logger
+        with open(args.out+str(args.id)+'.csv', 'w') as f:  # Just use 'w' mode in 3.x
+
+            w = csv.DictWriter(f, log.keys())
+            w.writeheader()
+
+            for i in range(len(log['min'])):
+                w.writerow({key: log[key][i] for key in log})
+
+        # Append to main logger
+        with open(args.main_out, 'a') as f:
+            w = csv.DictWriter(f, main_log.keys())
+            w.writerow(main_log)
+
+def read_jobs(lines, parser, defaults):
+    '''Reads the jobs of a batch, in JSON lines (an object per line) or CSV
+    (with a header) format. The keys are the long names of the options
+    (Ex.: pop-size or pop_size), the missing ones take the default value.
+
+    Args:
+        lines (list): Lines of the batch file.
+        parser (ArgumentParser): Parser of the launcher, gives the type of
+                                 each option.
+        defaults (Namespace): Options of the command line.
+
+    Returns:
+        list: Options of each job, as Namespace instances.
+
+    Raises:
+        ValueError: If a job has an option that does not exist.
+    '''
+    lines = [line for line in lines if line.strip()]
+
+    if len(lines) > 0 and lines[0].lstrip().startswith('{'):
+        rows = [json.loads(line) for line in lines]
+    else:
+        rows = list(csv.DictReader(lines))
+
+    types = {action.dest: action.type for action in parser._actions}
+
+    jobs = []
+    for row in rows:
+        job = dict(vars(defaults))
+
+        for key, value in row.items():
+            dest = key.lstrip('-').replace('-', '_')
+            if dest not in types:
+                raise ValueError(str(key) + ' is not a valid option.')
+
+            if value == '':
+                continue # Empty CSV field
+
+            if isinstance(value, str) and types[dest] is not None:
+                value = types[dest](value)
+
+            job[dest] = value
+
+        jobs.append(argparse.Namespace(**job))
+
+    return jobs
+
+def main(argv=None):
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.batch is None:
+        error = check_job(args)
+        if error is not None:
+            print('Error! ', error)
+            quit()
+
+        log = run_job(args)
+        close_problems()
+
+        save_job(args, log)
+        return
+
+    # Batch mode
+    if args.batch == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(args.batch, 'r') as f:
+            lines = f.readlines()
+
+    try:
+        jobs = read_jobs(lines, parser, args)
+    except ValueError as e:
+        print('Error! ', e)
+        quit()
+
+    # Every job is checked before running any of them
+    for n, job in enumerate(jobs):
+        error = check_job(job)
+        if error is not None:
+            print('Error! job ', n, ': ', error)
+            quit()
+
+    # Independent random stream of each job, the n-th stream spawned from 
+    # its seed. Jobs with the same seed get different streams, and a batch 
+    # gives the same results when it is run again with the same seeds
+    seeds = [np.random.SeedSequence(job.seed, spawn_key=(n,)) for n, job in enumerate(jobs)]
+
+    if args.batch_workers is not None and args.batch_workers > 1:
+        if any(job.workers is not None for job in jobs):
+            print('Error! The evaluation workers (-w) can not be used with batch workers.')
+            quit()
+
+        # Each worker keeps the problems it loads, the results are saved
+        # by this process as they arrive
+        with concurrent.futures.ProcessPoolExecutor(args.batch_workers) as executor:
+            futures = {executor.submit(run_job, job, seed): job
+                       for job, seed in zip(jobs, seeds)}
+
+            for future in concurrent.futures.as_completed(futures):
+                save_job(futures[future], future.result())
+
+    else:
+        for job, seed in zip(jobs, seeds):
+            save_job(job, run_job(job, seed))
+
+    close_problems()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import numpy as np
+
+class LocalSearch():
+
+    def __init__(self, neighbourhood, first_improvement=False, max_iters=None):
+        '''Local search constructor.
+
+        Args:
+            neighbourhood: Neighbourhood instance of the problem, must implement
+                           set_solution, improving_move and apply_move methods
+                           (Ex.: problems.QAPSwapNeighbourhood).
+            first_improvement (bool): If true, the first improving neighbour is 
+                                      taken in each step, else the best one. 
+                                      Default: False.
+            max_iters (int or None): Maximum number of moves, if None the search
+                                     stops at a local optimum. Default: None.
+
+        Returns:
+            LocalSearch instance.
+        '''
+        self.neighbourhood = neighbourhood
+        self.first_improvement = first_improvement
+        self.max_iters = max_iters
+
+    def run(self, permu):
+        '''Improves the given permutation until a local optimum is found.
+
+        Args:
+            permu (ndarray): Initial solution.
+
+        Returns:
+            tuple(ndarray, float): Local optimum and its fitness value.
+        '''
+        self.neighbourhood.set_solution(permu)
+
+        n_moves = 0
+        while self.max_iters is None or n_moves < self.max_iters:
+
+            move = self.neighbourhood.improving_move(self.first_improvement)
+            if move is None:
+                break
+
+            self.neighbourhood.apply_move(move[0])
+            n_moves += 1
+
+        return np.array(self.neighbourhood.perm), self.neighbourhood.fitness
+
+    def __call__(self, permu):
+        return self.run(permu)
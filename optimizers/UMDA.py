@@ -2,6 +2,8 @@ import numpy as np
 import permu_utils as putils
 import math
 import datetime
+import time
+import functools
 
 class TimeoutError(Exception):
     def __init__(self, message):
@@ -26,14 +28,14 @@ class UMDA():
         '''
         # n = pop.shape[1]
         n, m = shape
-        freq = np.empty(shape, dtype=dtype)        
-        pop = np.hsplit(pop, m)
+        pop = np.asarray(pop, dtype=np.intp)[:, :m]
 
-        for i in range(n):
-            for j in range(m):
-                freq[i][j] = np.count_nonzero(pop[j] == i)
+        # Count the (column, value) pairs, values out of range are not counted
+        valid = pop < n
+        cols = np.broadcast_to(np.arange(m), pop.shape)
+        freq = np.bincount(cols[valid]*n + pop[valid], minlength=m*n)
 
-        return freq
+        return freq.reshape((m, n)).T.astype(dtype)
 
     def learn_distribution(self, pop, size, dtype=np.int32):
         '''Learn probability distibution based on the given population matrix.
@@ -54,13 +56,12 @@ class UMDA():
             n = pop.shape[1]
             m = size 
 
-        freq = np.zeros(shape=(n, m), dtype=dtype)        
+        # Count the (position, value) pairs of the whole population at once
+        pop = np.asarray(pop, dtype=np.intp)
+        pairs = np.arange(pop.shape[1])*m + pop
+        freq = np.bincount(pairs.ravel(), minlength=n*m)
 
-        for i in range(pop.shape[0]):
-            for j in range(pop.shape[1]):
-                freq[j][pop[i][j]] += 1 
-
-        return freq
+        return freq.reshape((n, m)).astype(dtype)
 
     def sample_population(self, 
                           p, 
@@ -70,7 +71,8 @@ class UMDA():
                           pop_f,
                           eval_func,
                           check_repeat,
-                          timeout=None):
+                          timeout=None,
+                          rng=None):
         '''Given a probability matrix of size nxm, n_samples number of solutions 
         of length m.
 
@@ -84,10 +86,15 @@ class UMDA():
             eval_func: Instance of the evaluation function.
             check_repeat (bool): Check if the sampled solution exists in the population, solutions won't be repeated.. 
             timeout (int or None): Enable timeout, in milliseconds. Default: None.
+            rng (numpy.random.Generator or None): Random number generator. 
+                           Default: None, a new generator.
         
         Returns:
             tuple(ndarray, ndarray) : sampled solutions matrix and the fitness array of the sampled solutions. 
         '''
+        if rng is None:
+            rng = np.random.default_rng()
+
         size = min(p.shape) # Size of the permutation to sample 
         permutation = p.shape[0] == p.shape[1] # Define search space
 
@@ -116,7 +123,7 @@ class UMDA():
                 else:
                     s_max = sum(p[0])
 
-                rand = np.random.uniform(0, s_max)
+                rand = rng.uniform(0, s_max)
                 ##############################################
                 if rand != 0:
 
@@ -173,7 +180,10 @@ class UMDA():
 
         return samples, samples_f 
 
-    def sample_ad_hoc_laplace(self, p, size, dtype=np.int8):
+    def sample_ad_hoc_laplace(self, p, size, dtype=np.int8, rng=None):
+        if rng is None:
+            rng = np.random.default_rng()
+
         p += 1 # Add one to remove 0 probability values
         sample = []
         for j in range(size): # For each position
@@ -186,7 +196,7 @@ class UMDA():
                 if i not in sample:
                     s_max += p_[i]
 
-            rand = np.random.uniform(0, s_max)
+            rand = rng.uniform(0, s_max)
 
             s = 0
             i = 0
@@ -203,12 +213,14 @@ class UMDA():
         p -= 1 # Restore p
         return np.array(sample, dtype=dtype)
 
-    def sample_ad_hoc_laplace_random(self, p, size, dtype=np.int8):
+    def sample_ad_hoc_laplace_random(self, p, size, dtype=np.int8, rng=None):
+        if rng is None:
+            rng = np.random.default_rng()
 
         p += 1 # Add one to remove 0 probability values
         sample = [None]*size
 
-        random_order = np.random.permutation(size)
+        random_order = rng.permutation(size)
 
         for j in random_order: # For each position
 
@@ -220,7 +232,7 @@ class UMDA():
                 if i not in sample:
                     s_max += p_[i]
 
-            rand = np.random.uniform(0, s_max)
+            rand = rng.uniform(0, s_max)
 
             s = 0
             i = 0
@@ -238,7 +250,10 @@ class UMDA():
         p -= 1 # Restore p
         return np.array(sample, dtype=dtype)
 
-    def sample_no_restriction(self, p, size, dtype=np.int8):
+    def sample_no_restriction(self, p, size, dtype=np.int8, rng=None):
+        if rng is None:
+            rng = np.random.default_rng()
+
 
         sample = [] # Generate sample
         s_max = sum(p[0])
@@ -248,7 +263,7 @@ class UMDA():
             # Probability for elements in the j's position 
             p_ = p[j]
 
-            rand = np.random.uniform(0, s_max)
+            rand = rng.uniform(0, s_max)
             s = 0
             i = 0
 
@@ -263,20 +278,23 @@ class UMDA():
 
         return np.array(sample, dtype=dtype)
 
-    def sample_no_restriction_random(self, p, size, dtype=np.int8):
+    def sample_no_restriction_random(self, p, size, dtype=np.int8, rng=None):
+        if rng is None:
+            rng = np.random.default_rng()
+
 
         s_max = sum(p[0])
 
         sample = [None]*size
 
-        random_order = np.random.permutation(size)
+        random_order = rng.permutation(size)
 
         for j in random_order: # For each position
 
             # Probability for elements in the j's position 
             p_ = p[j]
 
-            rand = np.random.uniform(0, s_max)
+            rand = rng.uniform(0, s_max)
             s = 0
             i = 0
 
@@ -292,6 +310,135 @@ class UMDA():
 
         return np.array(sample, dtype=dtype)
 
+    def sample_no_restriction_batch(self, p, size, n_samples, dtype=np.int8, rng=None):
+        '''Samples n_samples solutions at once, with the same distribution 
+        as sample_no_restriction. As every position is sampled independently,
+        it is also equivalent to sample_no_restriction_random.
+
+        Args:
+            p (ndarray): probability matrix.
+            size (int): Length of the samples.
+            n_samples (int): Number of solutions to sample.
+            dtype (numpy data type): Type of the samples. Default: np.int8.
+            rng (numpy.random.Generator or None): Random number generator. 
+                           Default: None, a new generator.
+
+        Returns:
+            ndarray: Matrix of samples, shape (n_samples, size).
+        '''
+        if rng is None:
+            rng = np.random.default_rng()
+
+        p = np.asarray(p[:size], dtype=np.float64)
+        m = p.shape[1]
+        s_max = np.sum(p[0])
+
+        # Cumulative tables of every row, shifted so that the flattened 
+        # table is sorted and a single searchsorted call finds every value
+        offsets = np.arange(size)*(np.max(np.sum(p, axis=1)) + 1)
+        cum = (np.cumsum(p, axis=1) + offsets[:, None]).ravel()
+
+        rand = rng.uniform(0, s_max, size=(n_samples, size))
+        indx = np.searchsorted(cum, rand + offsets) - np.arange(size)*m
+
+        return np.minimum(indx, m-1).astype(dtype)
+
+    def sample_ad_hoc_laplace_batch(self, p, size, n_samples, 
+                                    random_order=False, dtype=np.int8, rng=None):
+        '''Samples n_samples permutations at once, with the same distribution
+        as sample_ad_hoc_laplace (or sample_ad_hoc_laplace_random if 
+        random_order is true). The samples are built in lockstep, a position
+        of every sample at a time, masking the already used values.
+
+        Args:
+            p (ndarray): probability matrix.
+            size (int): Length of the samples.
+            n_samples (int): Number of solutions to sample.
+            random_order (bool): If true, the positions of each sample are 
+                                 sampled in a random order. Default: False.
+            dtype (numpy data type): Type of the samples. Default: np.int8.
+            rng (numpy.random.Generator or None): Random number generator. 
+                           Default: None, a new generator.
+
+        Returns:
+            ndarray: Matrix of samples, shape (n_samples, size).
+        '''
+        if rng is None:
+            rng = np.random.default_rng()
+
+        p = np.asarray(p[:size], dtype=np.float64) + 1 # Remove 0 probability values
+
+        samples = np.empty((n_samples, size), dtype=dtype)
+        used = np.zeros((n_samples, size), dtype=bool) # Values already in each sample 
+        rows = np.arange(n_samples)
+
+        if random_order:
+            order = np.argsort(rng.uniform(size=(n_samples, size)), axis=1)
+        else:
+            order = np.broadcast_to(np.arange(size), (n_samples, size))
+
+        for j in range(size):
+
+            # Probabilities of the position of each sample, without used values
+            positions = order[:, j]
+            cum = np.cumsum(np.where(used, 0, p[positions]), axis=1)
+
+            rand = rng.uniform(0, cum[:, -1])
+
+            # First not used value which cumulative probability reaches rand
+            values = np.argmax((cum >= rand[:, None]) & ~used, axis=1)
+
+            samples[rows, positions] = values
+            used[rows, values] = True
+
+        return samples
+
+    # Search space of the samples of each sampling function, the 
+    # no-restriction samples are not permutations
+    sampling_spaces = {'ad-hoc-laplace': 'permutation',
+                       'ad-hoc-laplace-random': 'permutation',
+                       'no-restriction': 'vj',
+                       'no-restriction-random': 'vj'}
+
+    def get_sampling_func(self, name):
+        '''Finds the sampling function with the given name, as used in the 
+        launcher and the configuration files.
+
+        Args:
+            name (str): Ex.: 'ad-hoc-laplace', 'no-restriction-random'.
+
+        Returns:
+            func or None: The sampling function, None if the name is not valid.
+        '''
+        sampling_funcs = {
+            'ad-hoc-laplace': self.sample_ad_hoc_laplace,
+            'ad-hoc-laplace-random': self.sample_ad_hoc_laplace_random,
+            'no-restriction': self.sample_no_restriction,
+            'no-restriction-random': self.sample_no_restriction_random}
+
+        return sampling_funcs.get(name)
+
+    def get_batch_sampler(self, sampling_func):
+        '''Finds the batched version of the given sampling function.
+
+        Args:
+            sampling_func: Instance of a sampling function of UMDA.
+
+        Returns:
+            func or None: Function that is given p, size, n_samples and rng and 
+                          returns a matrix of samples, None if the sampling 
+                          function has no batched version.
+        '''
+        batch_samplers = {
+            'sample_ad_hoc_laplace': functools.partial(self.sample_ad_hoc_laplace_batch, 
+                                                       random_order=False),
+            'sample_ad_hoc_laplace_random': functools.partial(self.sample_ad_hoc_laplace_batch, 
+                                                              random_order=True),
+            'sample_no_restriction': self.sample_no_restriction_batch,
+            'sample_no_restriction_random': self.sample_no_restriction_batch}
+
+        return batch_samplers.get(getattr(sampling_func, '__name__', None))
+
     def sample_population_v2(self, 
                           p, 
                           sampling_func,
@@ -302,13 +449,69 @@ class UMDA():
                           eval_func,
                           transformation,
                           check_repeat,
-                          timeout=None):
+                          timeout=None,
+                          batch_eval_func=None,
+                          pop_index=None,
+                          batch_transformation=None,
+                          stats=None,
+                          rng=None):
         '''New sampling method.
+
+        Solutions are sampled in batches, one batch of all the remaining
+        solutions at a time, so that they can be evaluated together.
+
+        Args: 
+            p (ndarray): probability matrix.
+            sampling_func: Instance of the sampling function, given p, the size 
+                           of the sample and rng returns a single sample.
+            samples (ndarray): Matrix where samples are going to be stored.
+            samples_f (ndarray): Array where the fitness values of the sampled solutions are going to be stored.
+            pop (ndarray): Population matrix.
+            pop_f (ndarray): Fitness array of the given population (pop).
+            eval_func: Instance of the evaluation function.
+            transformation: Function to transform a sample to a permutation or None.
+            check_repeat (bool): Check if the sampled solution exists in the population, solutions won't be repeated.. 
+            timeout (int or None): Enable timeout, in milliseconds. Default: None.
+            batch_eval_func: Evaluation function that takes a matrix of permutations and
+                             returns an array with their fitness values. If given, it is used 
+                             instead of eval_func. Default: None.
+            pop_index (permu_utils.PopulationIndex or None): Hash index of the population.
+                             If given, it is used to check repeated solutions, 
+                             and solutions repeated inside the sampled batch are
+                             also discarded, before they are evaluated. 
+                             Default: None.
+            batch_transformation: Function to transform a matrix of samples to permutations.
+                             If given, it is used instead of transformation. Default: None.
+            stats (dict or None): If given, the seconds spent sampling, decoding
+                                  and evaluating are added to its 'time sample', 
+                                  'time decode' and 'time eval' keys, and the 
+                                  number of evaluations, rejected (repeated) 
+                                  samples and extra batches to its 'evaluations',
+                                  'rejected' and 'retries' keys. Default: None.
+            rng (numpy.random.Generator or None): Random number generator, given 
+                                  to the sampling function. Default: None, a 
+                                  new generator.
+
+        Returns:
+            tuple(ndarray, ndarray) : sampled solutions matrix and the fitness array of the sampled solutions. 
         '''
+        if rng is None:
+            rng = np.random.default_rng()
+
         size = min(p.shape) # Size of the permutation to sample 
 
+        batch_sampling_func = self.get_batch_sampler(sampling_func)
+
+        # Keys of the accepted samples, to discard repeated samples
+        sampled_keys = set()
+
         start = datetime.datetime.now()
         n_sampled = 0 # Number of permutations sampled and added to the new pop 
+        n_batches = 0
+
+        t_sample = t_decode = t_eval = 0.
+        n_evaluated = 0
+        n_rejected = 0
 
         while n_sampled < samples.shape[0]:
 
@@ -316,35 +519,86 @@ class UMDA():
             delta_t = datetime.datetime.now() - start
             if type(timeout) == int and int(delta_t.total_seconds() * 1000) >= timeout:
                 raise TimeoutError('Error: Timeout passed when sampling new solutions.')
-                
-            sample = sampling_func(p, size=size)
+
+            n_left = samples.shape[0] - n_sampled
+            n_batches += 1
+
+            t0 = time.perf_counter()
+
+            if batch_sampling_func is not None:
+                batch = batch_sampling_func(p, size=size, n_samples=n_left, 
+                                            dtype=samples.dtype, rng=rng)
+            else:
+                batch = [sampling_func(p, size=size, dtype=samples.dtype, rng=rng) 
+                         for _ in range(n_left)]
+
+            t1 = time.perf_counter()
 
             # If needed transform vj to permu
-            if transformation != None:
-                sample = transformation(sample)
+            if batch_transformation is not None:
+                batch = batch_transformation(np.asarray(batch))
 
-            # Evaluate the sampled permu
-            f = eval_func(sample)
+            elif transformation != None:
+                batch = [transformation(sample) for sample in batch]
 
-            if f in pop_f and check_repeat:
-                # Check if the sampled solution exists in the population
-                i = 0
-                repeated = False
-                while not repeated and i < pop.shape[0]:
-                    repeated = np.all(pop[i] == sample)
-                    i += 1
+            batch = np.array(batch)
 
-                if not repeated:
-                    # Add the sampled solution to the population 
-                    samples[n_sampled] = sample
-                    samples_f[n_sampled] = f
-                    n_sampled += 1
+            t2 = time.perf_counter()
 
-            # elif not check_repeat:
+            # The repeated samples are found with the index before the 
+            # evaluation, only the accepted ones are evaluated
+            if check_repeat and pop_index is not None:
+                keep = []
+                for i, key in enumerate(pop_index.keys(batch)):
+                    if key not in pop_index.counts and key not in sampled_keys:
+                        sampled_keys.add(key)
+                        keep.append(i)
+
+                n_rejected += len(batch) - len(keep)
+                batch = batch[np.asarray(keep, dtype=np.intp)]
+
+            t3 = time.perf_counter()
+
+            # Evaluate the sampled permus
+            if len(batch) == 0:
+                batch_f = []
+            elif batch_eval_func is not None:
+                batch_f = batch_eval_func(batch)
             else:
-                # Do not check if the sampled ppulation already exists in pop
-                samples[n_sampled] = sample
-                samples_f[n_sampled] = f
-                n_sampled += 1
+                batch_f = [eval_func(sample) for sample in batch]
+
+            batch_f = np.asarray(batch_f)
+            n_evaluated += len(batch)
+
+            t4 = time.perf_counter()
+
+            # Without the index, the fitness filters the samples to compare
+            if check_repeat and pop_index is None:
+                keep = []
+                for i, (sample, f) in enumerate(zip(batch, batch_f)):
+                    # Check if the sampled solution exists in the population
+                    if f not in pop_f or not np.any(np.all(pop == sample, axis=1)):
+                        keep.append(i)
+
+                keep = np.asarray(keep, dtype=np.intp)
+                n_rejected += len(batch) - len(keep)
+                batch, batch_f = batch[keep], batch_f[keep]
+
+            samples[n_sampled:n_sampled+len(batch)] = batch
+            samples_f[n_sampled:n_sampled+len(batch)] = batch_f
+            n_sampled += len(batch)
+
+            # Filtering repeated samples is part of the sampling
+            t_sample += (t1 - t0) + (t3 - t2) + (time.perf_counter() - t4)
+            t_decode += t2 - t1
+            t_eval += t4 - t3
+
+        if stats is not None:
+            stats['time sample'] = stats.get('time sample', 0) + t_sample
+            stats['time decode'] = stats.get('time decode', 0) + t_decode
+            stats['time eval'] = stats.get('time eval', 0) + t_eval
+            stats['evaluations'] = stats.get('evaluations', 0) + n_evaluated
+            stats['rejected'] = stats.get('rejected', 0) + n_rejected
+            stats['retries'] = stats.get('retries', 0) + max(0, n_batches - 1)
 
         return samples, samples_f
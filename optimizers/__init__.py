@@ -1 +1,2 @@
 from optimizers.UMDA import UMDA
+from optimizers.LocalSearch import LocalSearch
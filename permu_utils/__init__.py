@@ -1,8 +1,6 @@
 import numpy as np
 import math
-import random
 import itertools as it
-import matplotlib.pyplot as plt 
 
 # def random_permutation(n):
 #     '''Generate a random permutation of the specified length.
@@ -58,28 +56,36 @@ def set2np(set_, n, dtype):
     '''
     return np.array(list(set_), dtype=dtype).reshape((len(set_), n))
 
-def random_population(n, size, dtype):
+def random_population(n, size, dtype, rng=None):
     '''Generate a random population of permutations.
 
     Args:
         n (int) : length of the permutations. 
         size (int): size of the population.
         dtype: numpy type.
+        rng (numpy.random.Generator or None): Random number generator. 
+                                              Default: None, a new generator.
 
     Returns:
         ndarray: Poulation of random permutations.
     '''
     # Check given  population size
     assert size <= math.factorial(n), 'Population size too large.' 
-    
-    l = list(range(n))
-    pset = set()
-    while len(pset) < size:
-        random.shuffle(l)
-        pset.add(tuple(l))
 
-    # return np.array(list(pset)).reshape((size, n))
-    return set2np(pset, n, dtype=dtype)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    pop = np.empty((0, n), dtype=dtype)
+    while pop.shape[0] < size:
+        # Shuffle a row for each missing permutation, the repeated ones are
+        # discarded keeping the first occurrence
+        new = rng.permuted(np.tile(np.arange(n, dtype=dtype), (size-pop.shape[0], 1)), axis=1)
+        pop = np.concatenate((pop, new))
+
+        _, first = np.unique(pop, axis=0, return_index=True)
+        pop = pop[np.sort(first)]
+
+    return pop
 
 def discordancesToPermut(indCode, refer):
     n = len(indCode)
@@ -142,6 +148,65 @@ def vj2permu(vj):
     permu.append(e[0])
     return np.array(permu)
 
+def permu2vj_batch(pop, dtype=np.int64):
+    '''Transform every permutation of a population to its Vj representation.
+    For each position, the smaller elements to its right are counted in all 
+    the rows at once, O(N*n^2) work in n vectorized steps. It is faster 
+    than permu2vj on each row (O(n) numpy calls per row) for every size.
+
+    Args:
+        pop (ndarray): Population matrix of permutations.
+        dtype: numpy type of the returned matrix. Default: np.int64.
+
+    Returns:
+        ndarray: Vj matrix, shape (N, n-1).
+    '''
+    pop = np.asarray(pop)
+    n = pop.shape[1]
+    vj = np.empty((pop.shape[0], n-1), dtype=dtype)
+
+    for i in range(n-1):
+        vj[:, i] = np.count_nonzero(pop[:, i+1:] < pop[:, i, None], axis=1)
+
+    return vj
+
+# Largest permutation size decoded by vj2permu_batch in vectorized steps, 
+# the O(N*n^2) work is slower than vj2permu on each row above it
+VJ_BATCH_MAX_SIZE = 128
+
+def vj2permu_batch(vj, dtype=np.int64):
+    '''Transform every Vj vector of the given matrix to a permutation.
+    Up to VJ_BATCH_MAX_SIZE the permutations are built from the right in 
+    n vectorized steps, O(N*n^2) work: each vj[i] is the value of the i-th 
+    element among the elements at its right, so the elements already 
+    placed that are greater or equal are shifted by one. Larger vectors are
+    decoded with vj2permu, row by row.
+
+    Args:
+        vj (ndarray): Matrix of Vj vectors, shape (N, n-1).
+        dtype: numpy type of the returned matrix. Default: np.int64.
+
+    Returns:
+        ndarray: Population matrix of permutations, shape (N, n).
+    '''
+    vj = np.asarray(vj)
+    n = vj.shape[1] + 1
+
+    if n > VJ_BATCH_MAX_SIZE:
+        permu = np.empty((vj.shape[0], n), dtype=dtype)
+        for i in range(vj.shape[0]):
+            permu[i] = vj2permu(vj[i])
+        return permu
+
+    permu = np.zeros((vj.shape[0], n), dtype=dtype)
+    permu[:, :-1] = vj
+
+    for i in range(n-2, -1, -1):
+        tail = permu[:, i+1:]
+        tail += tail >= permu[:, i, None]
+
+    return permu
+
 def transform(pop, func):
     '''Applies a trasformation function to every individual of the population.
     
@@ -196,6 +261,8 @@ def fancy_matrix_plot(m, title=None):
         m (ndarray): two dimentional numpy array.
         title (str or None): Title of the graphic. Default: None. 
     '''
+    import matplotlib.pyplot as plt # Only loaded when plotting
+
     plt.matshow(m)
     # Loop over data dimensions and create text annotations.
     for i in range(m.shape[0]):
@@ -222,3 +289,68 @@ def invert(sigma, dtype):
         inv[sigma[i]] = i
 
     return inv
+
+class PopulationIndex():
+
+    def __init__(self, pop, dtype):
+        '''Hash index of the permutations of a population, used to check if a 
+        permutation is in the population in O(n).
+
+        Args:
+            pop (ndarray): Population matrix.
+            dtype: numpy type of the permutations, used to build the keys.
+        '''
+        self.dtype = dtype
+        self.counts = {}
+        self.add_all(pop)
+
+    def key(self, permu):
+        '''Compact key of the given permutation, its bytes.
+        '''
+        return np.asarray(permu, dtype=self.dtype).tobytes()
+
+    def add(self, permu):
+        '''Adds a permutation to the index.
+        '''
+        key = self.key(permu)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def remove(self, permu):
+        '''Removes a permutation from the index.
+        '''
+        key = self.key(permu)
+        if self.counts[key] == 1:
+            del self.counts[key]
+        else:
+            self.counts[key] -= 1
+
+    def keys(self, pop):
+        '''Keys of every permutation of a population matrix, built at once.
+        '''
+        pop = np.ascontiguousarray(pop, dtype=self.dtype)
+        if pop.shape[0] == 0:
+            return []
+        row = np.dtype((np.void, pop.dtype.itemsize*pop.shape[1]))
+
+        return pop.view(row).ravel().tolist()
+
+    def add_all(self, pop):
+        '''Adds every permutation of a population matrix to the index.
+        '''
+        for key in self.keys(pop):
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def remove_all(self, pop):
+        '''Removes every permutation of a population matrix from the index.
+        '''
+        for key in self.keys(pop):
+            if self.counts[key] == 1:
+                del self.counts[key]
+            else:
+                self.counts[key] -= 1
+
+    def __contains__(self, permu):
+        return self.key(permu) in self.counts
+
+    def __len__(self):
+        return sum(self.counts.values())
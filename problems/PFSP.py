@@ -1,6 +1,9 @@
 import numpy as np
 import os
 
+from problems.cache import load_cached
+from problems.parser import iter_pfsp_instances, read_instance
+
 class PFSP():
 
     def __init__(self, instances_dir='instances/PFSP'):
@@ -8,49 +11,31 @@ class PFSP():
         """
         pass
 
-    def load_instance(self, instance_name):
+    def load_instance(self, instance_name, cache=True, index=0):
         """Loads saved PFSP instance.
         
         Args: 
             instance_name (str): Instance file name.
+            cache (bool): If true, the instance is read from its binary cache 
+                          (see problems.cache), created if needed. Default: True.
+            index (int): Position of the instance in the file, for Taillard's
+                         files with many instances. Default: 0.
        
         Returns:
             ndarray: PFSP instance matrix (machines x jobs).
         """
-        f = open(instance_name, 'r')
-        lines = f.readlines()
-        f.close()
-        
-        # Find instance size
-        row = []
-        for item in lines[1].split(' '):
-            try:
-                row.append(int(item))
-            except:
-                pass
-        
-        n_jobs = row[0]
-        n_machines = row[1]
-
-        lines = lines[3:]
-        
-        instance = np.empty((n_machines, n_jobs), dtype=np.int)
+        if cache:
+            return load_cached(instance_name, self._parse_instance, index)
 
-        # Read instance matrix        
-        for i in range(n_machines):
-            row_ = lines[i].strip('\n').split(' ')
-            row = []
-            # Check for valid data in the row string
-            for item in row_:
-                try:
-                    row.append(int(item))
-                except:
-                    pass
+        return self._parse_instance(instance_name, index)
 
-            for j in range(n_jobs):
-                instance[i][j] = row[j]
+    def _parse_instance(self, instance_name, index=0):
+        """Reads the text file of a PFSP instance, in Taillard's format.
 
-        return instance
+        Returns:
+            ndarray: PFSP instance matrix (machines x jobs).
+        """
+        return read_instance(iter_pfsp_instances(instance_name), index)
 
     def evaluate(self, permu, times, 
                  makespan=False,
@@ -98,6 +83,202 @@ class PFSP():
             # TOTAL FLOW TIME
             return tft
 
+    def evaluate_batch(self, pop, times):
+        """Evaluates every permutation of the given population at once.
+
+        The completion time recurrence is run position by position for the 
+        whole population. The machines of a job are solved together using 
+        C[k] = cumsum[k] + max_{l<=k}(C_prev[l] - cumsum[l-1]), the unrolled 
+        form of C[k] = max(C[k-1], C_prev[k]) + p[k].
+
+        Args:
+            pop (ndarray): Population matrix, one permutation of jobs per row.
+            times (ndarray): PFSP instance matrix (machines x jobs).
+
+        Returns:
+            tuple(ndarray, ndarray): makespan and total flow time of each 
+                                     permutation of the population.
+        """
+        pop = np.asarray(pop, dtype=np.intp)
+        if pop.ndim == 1:
+            pop = pop.reshape((1, -1))
+
+        n_rows, n_jobs = pop.shape
+
+        # Processing times, (jobs x machines), and their cumulative sums
+        p = np.asarray(times, dtype=np.int64).T
+        cum = np.cumsum(p, axis=1)
+        cum_prev = cum - p
+
+        completion = np.zeros((n_rows, p.shape[1]), dtype=np.int64)
+        tft = np.zeros(n_rows, dtype=np.int64)
+
+        for job_i in range(n_jobs):
+            jobs = pop[:, job_i]
+            completion = cum[jobs] + np.maximum.accumulate(completion - cum_prev[jobs], 
+                                                           axis=1)
+            tft += completion[:, -1]
+
+        return completion[:, -1], tft
+
+class PFSPInsertNeighbourhood():
+
+    def __init__(self, times, makespan=False):
+        """Insertion neighbourhood of a PFSP solution.
+
+        All the insertion positions of a job are scored together. For the 
+        makespan this takes O(n*m), using the head and tail matrices of the 
+        sequence without the job (Taillard's acceleration). The total flow 
+        time has no such shortcut: the jobs after each insertion position 
+        are scheduled again, with a recurrence vectorized over the positions,
+        which is O(n^2*m) per job.
+
+        Args:
+            times (ndarray): PFSP instance matrix (machines x jobs).
+            makespan (bool): If true the makespan is optimized, else the total 
+                             flow time. Default: False.
+        """
+        # Processing times, (jobs x machines)
+        self.p = np.asarray(times, dtype=np.int64).T
+        self.cum = np.cumsum(self.p, axis=1)
+        self.cum_prev = self.cum - self.p
+        # Same for the machines in reverse order, used by the tails
+        self.cum_rev = np.cumsum(self.p[:, ::-1], axis=1)
+        self.cum_rev_prev = self.cum_rev - self.p[:, ::-1]
+
+        self.makespan = makespan
+
+        self.perm = None
+        self.fitness = None
+
+    def _heads(self, sequence):
+        """Completion time of each job of the sequence in every machine.
+        """
+        heads = np.zeros((len(sequence), self.p.shape[1]), dtype=np.int64)
+        prev = np.zeros(self.p.shape[1], dtype=np.int64)
+        for i, job in enumerate(sequence):
+            prev = self.cum[job] + np.maximum.accumulate(prev - self.cum_prev[job])
+            heads[i] = prev
+        return heads
+
+    def _tails(self, sequence):
+        """Time from the start of each job of the sequence in every machine 
+        until the end of the schedule.
+        """
+        tails = np.zeros((len(sequence), self.p.shape[1]), dtype=np.int64)
+        next_ = np.zeros(self.p.shape[1], dtype=np.int64)
+        for i in range(len(sequence)-1, -1, -1):
+            job = sequence[i]
+            next_ = self.cum_rev[job] + np.maximum.accumulate(next_ - self.cum_rev_prev[job])
+            tails[i] = next_[::-1]
+        return tails
+
+    def objective(self, sequence):
+        """Objective value of the given sequence of jobs.
+        """
+        heads = self._heads(sequence)
+        if self.makespan:
+            return int(heads[-1, -1])
+        return int(np.sum(heads[:, -1]))
+
+    def insert_objectives(self, sequence, job):
+        """Objective values of inserting the job in every position of the 
+        sequence.
+
+        Args:
+            sequence (ndarray): Sequence of jobs, without the job to insert.
+            job (int): Job to insert.
+
+        Returns:
+            ndarray: Array of length len(sequence)+1, the value in index k is 
+                     the objective value of inserting the job at position k.
+        """
+        n = len(sequence) + 1
+        m = self.p.shape[1]
+
+        heads = self._heads(sequence)
+
+        # Completion times of the job inserted in each position
+        heads_prev = np.zeros((n, m), dtype=np.int64)
+        heads_prev[1:] = heads
+        inserted = self.cum[job] + np.maximum.accumulate(heads_prev - self.cum_prev[job], 
+                                                         axis=1)
+
+        if self.makespan:
+            tails = np.zeros((n, m), dtype=np.int64)
+            tails[:-1] = self._tails(sequence)
+            return np.max(inserted + tails, axis=1)
+
+        # Total flow time, the jobs before the insertion keep their heads and 
+        # the following ones are scheduled again from the inserted job
+        prefix = np.zeros(n, dtype=np.int64)
+        prefix[1:] = np.cumsum(heads[:, -1])
+        tft = prefix + inserted[:, -1]
+
+        completion = inserted
+        for t in range(n-1):
+            active = n-1-t # Insertion positions with jobs left to schedule
+            jobs = sequence[t:t+active]
+            completion = self.cum[jobs] + np.maximum.accumulate(completion[:active] - self.cum_prev[jobs], 
+                                                                axis=1)
+            tft[:active] += completion[:, -1]
+
+        return tft
+
+    def set_solution(self, perm):
+        """Sets the current solution.
+
+        Args:
+            perm: Permutation of jobs to take as current solution.
+
+        Returns:
+            int: fitness value of the given permutation.
+        """
+        self.perm = np.array(perm, dtype=np.intp)
+        self.fitness = self.objective(self.perm)
+        return self.fitness
+
+    def improving_move(self, first_improvement=False):
+        """Finds a move that improves the current solution. A move takes the 
+        job of position i and inserts it in position k.
+
+        Args:
+            first_improvement (bool): If true, the best insertion of the first 
+                                      job (in position order) that improves the 
+                                      solution is returned, else the best move. 
+                                      Default: False.
+
+        Returns:
+            tuple or None: ((i, k), delta) of the move, None if there is no 
+                           improving move.
+        """
+        best = None
+        for i in range(len(self.perm)):
+
+            sequence = np.delete(self.perm, i)
+            values = self.insert_objectives(sequence, self.perm[i])
+
+            k = int(np.argmin(values))
+            delta = int(values[k]) - self.fitness
+
+            if delta < 0 and (best is None or delta < best[1]):
+                best = ((i, k), delta)
+                if first_improvement:
+                    break
+
+        return best
+
+    def apply_move(self, move):
+        """Moves the job of position i to position k.
+
+        Args:
+            move (tuple): (i, k) positions.
+        """
+        i, k = move
+        job = self.perm[i]
+        self.perm = np.insert(np.delete(self.perm, i), k, job)
+        self.fitness = self.objective(self.perm)
+
 if __name__ == '__main__':
 
     pfsp = PFSP()
@@ -1,6 +1,9 @@
 import numpy as np
 import os
 
+from problems.cache import load_cached
+from problems.parser import iter_qap_instances, read_instance
+
 class InstanceSizeError(Exception):
     def __init__(self, message):
         super().__init__(message)
@@ -12,63 +15,43 @@ class QAP():
         """
         pass
 
-    def load_instance(self, instance_name):
+    def load_instance(self, instance_name, cache=True, index=0):
         """Loads saved QAP instance.
         
         Args: 
             instance_name (str): Instance file name.
+            cache (bool): If true, the instance is read from its binary cache 
+                          (see problems.cache), created if needed. Default: True.
+            index (int): Position of the instance in the file, for files 
+                         with many instances. Default: 0.
        
         Returns:
             tuple: (distance_matrix, flow_matrix).
 
         Raises:
-            InstanceSizeError: Error while formatting the string from the instance 
-                to a numpy array. The array has not the desired size.
+            InstanceSizeError: The file ended before the matrices of the 
+                instance were complete.
         """
-        f = open(instance_name, 'r')
-        lines = f.readlines()
-        f.close()
-
-        size = int(lines[0].strip('\n').strip(' ')) 
-        del lines[0]
-
-        def _format(str_, size): 
-
-            matrix = np.empty((size, size), dtype=np.int)
-            for i in range(size):
-
-                str_ = lines[i].split(' ')
+        if cache:
+            matrices = load_cached(instance_name, self._parse_instance, index)
+        else:
+            matrices = self._parse_instance(instance_name, index)
 
-                # Clean row, str -> int
-                row = []
-                for item in str_:
-                    try:
-                        row.append(int(item.strip('\n')))
-                    except:
-                        pass
+        return matrices[0], matrices[1]
 
-                # Check for size errors
-                if len(row) != size:
-                    raise InstanceSizeError(
-                        'The instance matrix created from '
-                        + instance_name 
-                        + ', has not the correct size '
-                        + str(size) + ', instead its size is '
-                        + str(len(row)) + '.')
+    def _parse_instance(self, instance_name, index=0):
+        """Reads the text file of a QAP instance, in QAPLIB format with any 
+        layout of lines.
 
-                # Add data to the matrix 
-                for j in range(size):
-                    matrix[i][j] = int(row[j])
-
-            return matrix
-
-        distances = _format(lines, size)
-
-        lines = lines[size:]
-        
-        flow = _format(lines, size)
+        Returns:
+            ndarray: distance and flow matrices, shape (2, n, n).
+        """
+        try:
+            return read_instance(iter_qap_instances(instance_name), index)
 
-        return distances, flow
+        except EOFError as e:
+            raise InstanceSizeError('The instance matrices created from '
+                                    + instance_name + ' are not complete. ' + str(e))
         
     def evaluate(self, perm, distance_matrix, flow_matrix):
         """Evaluates the given permutation for the QAP problem.
@@ -93,10 +76,188 @@ class QAP():
                 distAB = distance_matrix[i][j]
                 flowAB = flow_matrix[factA][factB]
 
-                fitness += distAB*flowAB			
+                fitness += distAB*flowAB
 
         return fitness
 
+    def evaluate_batch(self, pop, distance_matrix, flow_matrix,
+                       max_elements=2**22):
+        """Evaluates every permutation of the given population at once.
+
+        The products are accumulated in 64 bit integers, so there is no
+        risk of overflow when the instance matrices have small dtypes.
+
+        Args:
+            pop (ndarray): Population matrix, one permutation per row.
+            distance_matrix: Matrix of distances between cities.
+            flow_matrix: The flow matrix.
+            max_elements (int): Maximum number of elements of the temporal
+                                (rows, n, n) array, larger populations are
+                                evaluated in chunks. Default: 2**22.
+
+        Returns:
+            ndarray: Fitness values of the given population, shape (pop_size,).
+        """
+        pop = np.asarray(pop, dtype=np.intp)
+        if pop.ndim == 1:
+            pop = pop.reshape((1, -1))
+
+        n_rows, size = pop.shape
+
+        dist = np.asarray(distance_matrix, dtype=np.int64)
+        flow = np.asarray(flow_matrix, dtype=np.int64)
+
+        fitness = np.empty(n_rows, dtype=np.int64)
+        chunk = max(1, max_elements // max(1, size*size))
+
+        for start in range(0, n_rows, chunk):
+            rows = pop[start:start+chunk]
+            # flow[perm[i]][perm[j]] for every permutation in the chunk
+            permuted = flow[rows[:, :, None], rows[:, None, :]]
+            fitness[start:start+chunk] = np.einsum('kij,ij->k', permuted, dist)
+
+        return fitness
+
+class QAPSwapNeighbourhood():
+
+    def __init__(self, distance_matrix, flow_matrix):
+        """2-swap neighbourhood of a QAP solution with incremental evaluation.
+
+        A matrix with the fitness difference of every swap move (the delta 
+        matrix) is kept for the current solution, so that each neighbour is 
+        scored in O(1). After a move is applied the matrix is updated in 
+        O(n^2) instead of evaluating the O(n^2) neighbours from scratch.
+
+        Args:
+            distance_matrix: Matrix of distances between cities.
+            flow_matrix: The flow matrix.
+        """
+        self.dist = np.asarray(distance_matrix, dtype=np.int64)
+        self.flow = np.asarray(flow_matrix, dtype=np.int64)
+        self.size = self.dist.shape[0]
+
+        self.perm = None
+        self.fitness = None
+        self.deltas = None
+
+    def set_solution(self, perm):
+        """Sets the current solution and computes its delta matrix.
+
+        Args:
+            perm: Permutation to take as current solution.
+
+        Returns:
+            int: fitness value of the given permutation.
+        """
+        self.perm = np.array(perm, dtype=np.intp)
+        # Flow matrix permuted by the solution, flow[perm[i]][perm[j]]
+        self._flow_p = self.flow[np.ix_(self.perm, self.perm)]
+
+        self.fitness = int(np.sum(self.dist*self._flow_p))
+        self.deltas = self._delta_rows(np.arange(self.size))
+
+        return self.fitness
+
+    def _delta_rows(self, rows):
+        """Computes the fitness difference of swapping positions r and s, for 
+        every r in rows and every position s.
+
+        Args:
+            rows (ndarray): Positions of the first element of the swaps.
+
+        Returns:
+            ndarray: Matrix of shape (len(rows), n).
+        """
+        A = self.dist
+        B = self._flow_p
+
+        R = rows[:, None]
+        S = np.arange(self.size)[None, :]
+
+        diag_m = np.sum(A*B, axis=1)
+        diag_n = np.sum(A*B, axis=0)
+
+        # Sums over every position k of the changes in the rows and columns 
+        m_rs = A[rows] @ B.T
+        m_sr = (A @ B[rows].T).T
+        n_rs = A[:, rows].T @ B
+        n_sr = (A.T @ B[:, rows]).T
+
+        delta = (m_rs + m_sr - diag_m[R] - diag_m[S]
+                 + n_rs + n_sr - diag_n[R] - diag_n[S])
+
+        # Remove the terms of k = r and k = s from the sums above
+        delta -= (A[R, R] - A[S, R])*(B[S, R] - B[R, R])
+        delta -= (A[R, S] - A[S, S])*(B[S, S] - B[R, S])
+        delta -= (A[R, R] - A[R, S])*(B[R, S] - B[R, R])
+        delta -= (A[S, R] - A[S, S])*(B[S, S] - B[S, R])
+
+        # Add the changes in the four corners, (r,r), (s,s), (r,s) and (s,r)
+        delta += A[R, R]*(B[S, S] - B[R, R]) + A[S, S]*(B[R, R] - B[S, S])
+        delta += A[R, S]*(B[S, R] - B[R, S]) + A[S, R]*(B[R, S] - B[S, R])
+
+        delta[R == S] = 0
+
+        return delta
+
+    def improving_move(self, first_improvement=False):
+        """Finds a move that improves the current solution.
+
+        Args:
+            first_improvement (bool): If true, the first improving swap in 
+                                      lexicographic order is returned, else 
+                                      the best swap. Default: False.
+
+        Returns:
+            tuple or None: ((r, s), delta) of the move, None if there is no 
+                           improving move.
+        """
+        if first_improvement:
+            improving = np.flatnonzero(np.triu(self.deltas < 0, 1))
+            if len(improving) == 0:
+                return None
+            indx = improving[0]
+
+        else:
+            indx = np.argmin(self.deltas)
+            if self.deltas.flat[indx] >= 0:
+                return None
+
+        r, s = divmod(int(indx), self.size)
+        return (r, s), int(self.deltas[r, s])
+
+    def apply_move(self, move):
+        """Swaps two positions of the current solution and updates the delta 
+        matrix.
+
+        Args:
+            move (tuple): (r, s) positions to swap.
+        """
+        r, s = move
+        self.fitness += int(self.deltas[r, s])
+
+        self.perm[[r, s]] = self.perm[[s, r]]
+        self._flow_p[[r, s]] = self._flow_p[[s, r]]
+        self._flow_p[:, [r, s]] = self._flow_p[:, [s, r]]
+
+        A = self.dist
+        B = self._flow_p
+
+        # O(1) update of the swaps (u, v) that do not involve r or s
+        a1 = A[r] - A[s]
+        b1 = B[s] - B[r]
+        a2 = A[:, r] - A[:, s]
+        b2 = B[:, s] - B[:, r]
+
+        self.deltas += ((a1[:, None] - a1[None, :])*(b1[:, None] - b1[None, :])
+                        + (a2[:, None] - a2[None, :])*(b2[:, None] - b2[None, :]))
+
+        # Swaps involving r or s are computed again
+        rows = np.array([r, s])
+        changed = self._delta_rows(rows)
+        self.deltas[rows] = changed
+        self.deltas[:, rows] = changed.T
+
 if __name__ == '__main__':
 
     qap = QAP(5)
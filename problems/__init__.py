@@ -1,2 +1,5 @@
-from problems.QAP import QAP
-from problems.PFSP import PFSP
+from problems.QAP import QAP, QAPSwapNeighbourhood
+from problems.PFSP import PFSP, PFSPInsertNeighbourhood
+from problems.loader import load_problem
+from problems.cache import load_cached
+from problems.parser import iter_qap_instances, iter_pfsp_instances
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import numpy as np
+
+def cache_path(instance_path, index=0):
+    '''Path of the binary cache of an instance, next to the instance file.
+    '''
+    if index == 0:
+        return instance_path + '.npy'
+
+    return instance_path + '.' + str(index) + '.npy'
+
+def load_cached(instance_path, parse, index=0):
+    '''Loads an instance from its binary cache (a .npy file next to the
+    instance), parsing the instance file and writing the cache if the
+    cache does not exist or is older than the instance.
+
+    The cache is opened as a read only memory map, so the processes that
+    load the same instance share its pages. The map is returned as a plain 
+    ndarray view, indexing an np.memmap element by element is several times
+    slower.
+
+    Args:
+        instance_path (str): Path of the instance file.
+        parse (function): Function that reads the instance with the given
+                          index of the file, parse(instance_path, index), 
+                          and returns it as an ndarray.
+        index (int): Position of the instance in the file. Default: 0.
+
+    Returns:
+        ndarray: The instance, read only.
+    '''
+    path = cache_path(instance_path, index)
+
+    try:
+        if os.stat(path).st_mtime_ns >= os.stat(instance_path).st_mtime_ns:
+            return np.asarray(np.load(path, mmap_mode='r'))
+
+    except (OSError, ValueError):
+        pass # Missing or invalid cache, parse the instance again
+
+    instance = parse(instance_path, index)
+
+    tmp = None
+    try:
+        # Written to a temporal file and renamed, so that other processes
+        # never read a partial cache
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                   suffix='.npy.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, instance)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+
+    except OSError:
+        # The instance directory is not writable, use the parsed instance
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+        return instance
+
+    return np.asarray(np.load(path, mmap_mode='r'))
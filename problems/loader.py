@@ -0,0 +1,57 @@
+from problems.QAP import QAP, QAPSwapNeighbourhood
+from problems.PFSP import PFSP, PFSPInsertNeighbourhood
+
+def load_problem(problem_name, instance_path, makespan=False, index=0):
+    '''Reads an instance and builds the evaluation functions of the problem.
+
+    Args:
+        problem_name (str): Name of the problem, 'QAP' or 'PFSP'.
+        instance_path (str): Path of the instance file.
+        makespan (bool): PFSP only, if true the makespan is optimized, else 
+                         the total flow time. Default: False.
+        index (int): Position of the instance in the file, for files with 
+                     many instances. Default: 0.
+
+    Returns:
+        dict: with 'size', 'evaluator', 'batch_evaluator' and 'neighbourhood' 
+              keys, and the 'problem' instance and its 'instance' arrays.
+
+    Raises:
+        ValueError: If the problem name is not valid.
+    '''
+    if problem_name == 'QAP':
+        problem = QAP() # Init problem
+        dist, flow = problem.load_instance(instance_path, index=index) # Read instance
+
+        def evaluator(permu):
+            return problem.evaluate(permu, dist, flow) 
+
+        def batch_evaluator(pop):
+            return problem.evaluate_batch(pop, dist, flow)
+
+        return {'problem': problem,
+                'instance': [dist, flow],
+                'size': dist.shape[0],
+                'evaluator': evaluator,
+                'batch_evaluator': batch_evaluator,
+                'neighbourhood': QAPSwapNeighbourhood(dist, flow)}
+
+    elif problem_name == 'PFSP':
+        problem = PFSP() # Init problem
+        instance = problem.load_instance(instance_path, index=index) # Read instance
+
+        def evaluator(permu):
+            return problem.evaluate(permu, instance, makespan=makespan) 
+
+        def batch_evaluator(pop):
+            # NOTE: Index 0 is the makespan, index 1 the TFT
+            return problem.evaluate_batch(pop, instance)[0 if makespan else 1]
+
+        return {'problem': problem,
+                'instance': [instance],
+                'size': instance.shape[1],
+                'evaluator': evaluator,
+                'batch_evaluator': batch_evaluator,
+                'neighbourhood': PFSPInsertNeighbourhood(instance, makespan=makespan)}
+
+    raise ValueError('Problem ' + str(problem_name) + ' is not a valid problem name.')
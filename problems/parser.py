@@ -0,0 +1,189 @@
+import itertools
+import numpy as np
+
+# Bytes that separate the tokens of an instance file
+_SEPARATORS = np.zeros(256, dtype=bool)
+_SEPARATORS[list(b' \t\n\r\x0b\x0c,:;')] = True
+
+# Numbers with more digits overflow 64 bit integers
+_MAX_DIGITS = 18
+
+def parse_integers(data):
+    '''Finds every integer of a buffer in one vectorized pass. The tokens are
+    separated by whitespace, commas, colons or semicolons, the tokens that
+    are not integers (words such as 'processing' or 'times') are ignored.
+
+    Args:
+        data (bytes): Text to parse.
+
+    Returns:
+        ndarray: The integers, in order, dtype int64.
+    '''
+    b = np.frombuffer(data, dtype=np.uint8)
+
+    idx = np.flatnonzero(~_SEPARATORS[b]) # Position of the bytes of the tokens
+    if len(idx) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # First byte (in idx) and length of each token
+    starts = np.flatnonzero(np.r_[True, np.diff(idx) != 1])
+    lengths = np.diff(np.r_[starts, len(idx)])
+
+    token = np.repeat(np.arange(len(starts)), lengths)
+    k = np.arange(len(idx))
+
+    c = b[idx].astype(np.int64)
+    is_digit = (c >= 48) & (c <= 57)
+    is_sign = (c == 45) & (k == starts[token]) # Leading minus sign
+
+    valid = ((np.add.reduceat(~is_digit & ~is_sign, starts) == 0)
+             & (np.add.reduceat(is_digit, starts) > 0)
+             & (lengths <= _MAX_DIGITS))
+
+    # Value of each digit by its position from the end of its token
+    exp = np.minimum(starts[token] + lengths[token] - k - 1, _MAX_DIGITS)
+    values = np.add.reduceat(np.where(is_digit, (c - 48)*10**exp, 0), starts)
+    values = np.where(is_sign[starts], -values, values)
+
+    return values[valid]
+
+class IntegerStream():
+
+    def __init__(self, path, chunk_size=2**22):
+        '''Integers of a file, read in chunks of bytes so that large files
+        are not loaded at once.
+
+        Args:
+            path (str): Path of the file.
+            chunk_size (int): Bytes read in each chunk. Default: 2**22.
+
+        Returns:
+            IntegerStream instance.
+        '''
+        self.path = path
+        self.chunk_size = chunk_size
+
+        self._file = open(path, 'rb')
+        self._rest = b'' # Bytes of a token split by the end of the last chunk
+        self._buffer = np.empty(0, dtype=np.int64)
+        self._pos = 0
+
+    def _read_chunk(self):
+        '''Parses the next chunk of the file.
+
+        Returns:
+            bool: False if the end of the file was reached.
+        '''
+        data = self._file.read(self.chunk_size)
+        if len(data) == 0:
+            if len(self._rest) == 0:
+                return False
+            data, self._rest = self._rest, b''
+
+        else:
+            data = self._rest + data
+
+            # The last token may continue in the next chunk
+            last = max(data.rfind(bytes([s])) for s in np.flatnonzero(_SEPARATORS))
+            data, self._rest = data[:last+1], data[last+1:]
+
+        self._buffer = np.concatenate((self._buffer[self._pos:], parse_integers(data)))
+        self._pos = 0
+
+        return True
+
+    def take(self, n):
+        '''Next n integers of the file.
+
+        Args:
+            n (int): Number of integers.
+
+        Returns:
+            ndarray: The integers, dtype int64.
+
+        Raises:
+            EOFError: If the file has less than n integers left.
+        '''
+        while len(self._buffer) - self._pos < n:
+            if not self._read_chunk():
+                raise EOFError(self.path + ' ended before the expected '
+                               + str(n) + ' integers were read.')
+
+        values = self._buffer[self._pos:self._pos+n]
+        self._pos += n
+
+        return values
+
+    def at_end(self):
+        '''True if there are no more integers in the file.
+        '''
+        while len(self._buffer) == self._pos:
+            if not self._read_chunk():
+                return True
+
+        return False
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_qap_instances(path, chunk_size=2**22):
+    '''Reads the QAP instances of a file in QAPLIB format (the size n,
+    followed by the n*n values of the distance and flow matrices) in any
+    layout of lines, one after the other.
+
+    Args:
+        path (str): Path of the instance file.
+        chunk_size (int): Bytes read in each chunk. Default: 2**22.
+
+    Yields:
+        ndarray: distance and flow matrices, shape (2, n, n).
+    '''
+    with IntegerStream(path, chunk_size) as stream:
+        while not stream.at_end():
+            n = int(stream.take(1)[0])
+            yield stream.take(2*n*n).reshape((2, n, n))
+
+def iter_pfsp_instances(path, chunk_size=2**22):
+    '''Reads the PFSP instances of a file in Taillard's format (the number
+    of jobs and machines, seed, upper and lower bound, followed by the
+    processing times of each machine), as in the original benchmark files
+    with many instances each.
+
+    Args:
+        path (str): Path of the instance file.
+        chunk_size (int): Bytes read in each chunk. Default: 2**22.
+
+    Yields:
+        ndarray: instance matrix (machines x jobs).
+    '''
+    with IntegerStream(path, chunk_size) as stream:
+        while not stream.at_end():
+            n_jobs, n_machines = (int(v) for v in stream.take(5)[:2])
+            yield stream.take(n_machines*n_jobs).reshape((n_machines, n_jobs))
+
+def read_instance(instances, index=0):
+    '''Instance with the given index of a file, the file is only read up to
+    the end of that instance.
+
+    Args:
+        instances (generator): Instances of the file, as returned by
+                               iter_qap_instances or iter_pfsp_instances.
+        index (int): Position of the instance in the file. Default: 0.
+
+    Returns:
+        ndarray: The instance.
+
+    Raises:
+        IndexError: If the file has not that many instances.
+    '''
+    for instance in itertools.islice(instances, index, None):
+        instances.close()
+        return instance
+
+    raise IndexError('There is no instance with index ' + str(index) + '.')
@@ -0,0 +1,517 @@
+import json
+import sqlite3
+import numpy as np
+
+class QuantileSketch():
+
+    # Number of values kept exactly, before the estimation starts
+    exact_size = 64
+
+    # Quantiles of the markers, the estimated ones (0.25, 0.5 and 0.75), the
+    # extremes and the middle points between them
+    probs = [0., .125, .25, .375, .5, .625, .75, .875, 1.]
+
+    def __init__(self, state=None):
+        '''Streaming estimate of the quartiles of a sequence of values, with
+        constant time and memory per value. The first exact_size values are
+        kept and their quartiles are exact, then the P² algorithm of Jain 
+        and Chlamtac (with a marker for each quantile of probs) estimates 
+        them, starting from the order statistics of the kept values.
+
+        Args:
+            state (str or None): State of a sketch, as returned by 
+                                 state(). Default: None, an empty sketch.
+
+        Returns:
+            QuantileSketch instance.
+        '''
+        state = {} if state is None else json.loads(state)
+
+        self.count = state.get('count', 0)
+        self.values = state.get('values', []) # Kept values, None once estimating
+        self.heights = state.get('heights')
+        self.positions = state.get('positions')
+
+    def state(self):
+        '''State of the sketch as a JSON string.
+        '''
+        if self.values is not None:
+            return json.dumps({'count': self.count, 'values': self.values})
+
+        return json.dumps({'count': self.count, 'values': None,
+                           'heights': self.heights, 'positions': self.positions})
+
+    def add(self, value):
+        '''Adds a value to the sketch.
+        '''
+        value = float(value)
+
+        if self.values is not None:
+            if len(self.values) < self.exact_size:
+                self.values.append(value)
+                self.count += 1
+                return
+
+            # The markers start at the order statistics of the kept values
+            values = sorted(self.values)
+            self.positions = [1 + int(round(p*(len(values)-1))) for p in self.probs]
+            self.heights = [values[n-1] for n in self.positions]
+            self.values = None
+
+        q, n = self.heights, self.positions
+
+        # Cell of the new value, the extremes are moved if needed
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[-1]:
+            q[-1] = value
+            k = len(q) - 2
+        else:
+            k = max(i for i in range(len(q)-1) if q[i] <= value)
+
+        for i in range(k+1, len(n)):
+            n[i] += 1
+        self.count += 1
+
+        # Markers away from their desired positions are moved one position,
+        # with the parabolic formula or, if it breaks the order, linearly
+        for i in range(1, len(q)-1):
+            d = 1 + self.probs[i]*(self.count-1) - n[i]
+
+            if (d >= 1 and n[i+1] - n[i] > 1) or (d <= -1 and n[i-1] - n[i] < -1):
+                s = 1 if d > 0 else -1
+
+                height = q[i] + s/(n[i+1] - n[i-1])*((n[i] - n[i-1] + s)*(q[i+1] - q[i])/(n[i+1] - n[i])
+                                                     + (n[i+1] - n[i] - s)*(q[i] - q[i-1])/(n[i] - n[i-1]))
+                if not q[i-1] < height < q[i+1]:
+                    height = q[i] + s*(q[i+s] - q[i])/(n[i+s] - n[i])
+
+                q[i] = height
+                n[i] += s
+
+    def quartiles(self):
+        '''First quartile, median and third quartile of the added values.
+
+        Returns:
+            tuple(float, float, float): q25, median and q75, None if no value 
+                                        was added.
+        '''
+        if self.count == 0:
+            return None, None, None
+
+        if self.values is not None:
+            return tuple(float(v) for v in np.quantile(self.values, [.25, .5, .75]))
+
+        return self.heights[2], self.heights[4], self.heights[6]
+
+class ResultStore():
+
+    # Columns of the runs table and their keys in the main log
+    run_columns = [('id', 'id'),
+                   ('date', 'date'),
+                   ('problem', 'problem name'),
+                   ('instance', 'instance'),
+                   ('max_iterations', 'max iterations'),
+                   ('iterations', 'iterations'),
+                   ('space', 'space'),
+                   ('sampling', 'sampling'),
+                   ('pop_size', 'pop size'),
+                   ('check_repeat', 'check repeat'),
+                   ('min', 'min')]
+
+    trace_columns = ['min', 'max', 'mean', 'median']
+
+    # Columns of the stats table and their keys in the log 
+    # (see Algorithm.stats_keys)
+    stats_columns = [('time_learn', 'time learn'),
+                     ('time_sample', 'time sample'),
+                     ('time_decode', 'time decode'),
+                     ('time_eval', 'time eval'),
+                     ('time_local_search', 'time local search'),
+                     ('time_replace', 'time replace'),
+                     ('evaluations', 'evaluations'),
+                     ('rejected', 'rejected'),
+                     ('retries', 'retries')]
+
+    aggregate_columns = ['instance', 'space', 'sampling', 'iteration', 
+                         'runs', 'mean', 'median', 'q25', 'q75', 'best']
+
+    def __init__(self, path, timeout=60.):
+        '''Results of the runs in a single SQLite file: the metadata of each run
+        (the fields of the main log) and the trace of each generation. The
+        database is used in WAL mode, so that many processes can write to it
+        while others read.
+
+        Args:
+            path (str): Path of the database file, created if it does not exist.
+            timeout (float): Seconds to wait for the lock of other writers.
+                             Default: 60.
+
+        Returns:
+            ResultStore instance.
+        '''
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout)
+
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+        with self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS runs (
+                                    id TEXT PRIMARY KEY, date TEXT, problem TEXT,
+                                    instance TEXT, max_iterations INTEGER,
+                                    iterations INTEGER, space TEXT, sampling TEXT,
+                                    pop_size INTEGER, check_repeat TEXT, min REAL)''')
+
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS traces (
+                                    run_id TEXT, iteration INTEGER,
+                                    min REAL, max REAL, mean REAL, median REAL,
+                                    PRIMARY KEY (run_id, iteration)) WITHOUT ROWID''')
+
+            # Instrumentation of each generation, for the logs that have it
+            self.conn.execute('CREATE TABLE IF NOT EXISTS stats ('
+                              'run_id TEXT, iteration INTEGER, '
+                              + ', '.join(c + ' REAL' for c, _ in self.stats_columns) + 
+                              ', PRIMARY KEY (run_id, iteration)) WITHOUT ROWID')
+
+            self.conn.execute('''CREATE INDEX IF NOT EXISTS runs_experiment
+                                    ON runs (instance, space, sampling)''')
+
+            # Statistics of the min of every run of a group in each iteration
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS aggregates (
+                                    instance TEXT, space TEXT, sampling TEXT,
+                                    iteration INTEGER, runs INTEGER, mean REAL,
+                                    median REAL, q25 REAL, q75 REAL, best REAL,
+                                    PRIMARY KEY (instance, space, sampling, iteration)
+                                 ) WITHOUT ROWID''')
+
+            # State of the quartile estimate (see QuantileSketch) of each 
+            # group and iteration
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS sketches (
+                                    instance TEXT, space TEXT, sampling TEXT,
+                                    iteration INTEGER, state TEXT,
+                                    PRIMARY KEY (instance, space, sampling, iteration)
+                                 ) WITHOUT ROWID''')
+
+            # Groups with replaced runs since their aggregates were computed
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS dirty (
+                                    instance TEXT, space TEXT, sampling TEXT,
+                                    PRIMARY KEY (instance, space, sampling))''')
+
+            # Groups saved before the aggregates or the sketches existed
+            legacy = self.conn.execute('''INSERT OR IGNORE INTO dirty 
+                                    SELECT DISTINCT instance, space, sampling FROM runs r
+                                    WHERE NOT EXISTS (SELECT 1 FROM sketches a 
+                                        WHERE a.instance = r.instance AND a.space = r.space 
+                                        AND a.sampling = r.sampling)''').rowcount
+
+        # Their aggregates are computed from the traces once
+        if legacy > 0:
+            self.update_aggregates()
+
+    def _remove_from_aggregates(self, run_id, group):
+        '''Removes the trace of a saved run from the runs, mean and best of 
+        the aggregates of its group. Used when a run is replaced, inside the 
+        transaction of add_run. The quartiles can not be undone, the group is
+        marked to compute them again.
+        '''
+        old = self.conn.execute('SELECT iteration, min FROM traces WHERE run_id = ?', 
+                                (run_id,)).fetchall()
+
+        self.conn.executemany('UPDATE aggregates SET runs = runs - 1, '
+                              'mean = CASE WHEN runs > 1 THEN (mean*runs - ?)/(runs - 1) END '
+                              'WHERE instance = ? AND space = ? AND sampling = ? '
+                              'AND iteration = ?', 
+                              [(v,) + group + (i,) for i, v in old])
+        self.conn.execute('DELETE FROM aggregates WHERE runs <= 0 AND instance = ? '
+                          'AND space = ? AND sampling = ?', group)
+
+        # The best value can not be undone, it is searched again in the group
+        self.conn.execute('UPDATE aggregates SET best = (SELECT MIN(traces.min) '
+                          'FROM traces JOIN runs ON traces.run_id = runs.id '
+                          'WHERE runs.instance = aggregates.instance '
+                          'AND runs.space = aggregates.space '
+                          'AND runs.sampling = aggregates.sampling '
+                          'AND traces.iteration = aggregates.iteration AND runs.id != ?) '
+                          'WHERE instance = ? AND space = ? AND sampling = ?', 
+                          (run_id,) + group)
+
+    def add_run(self, main_log, log):
+        '''Saves a run, its metadata and its trace are written in one transaction.
+        The aggregates of its group are updated in the same transaction, in
+        time proportional to the iterations of the run, not to the runs of
+        the group: the runs, mean and best exactly, and the median and 
+        quartiles with a QuantileSketch of each iteration.
+
+        Args:
+            main_log (dict): Metadata of the run, with the fields of the main
+                             log ('id', 'date', 'problem name', 'instance', ...).
+            log (dict): Log returned by the algorithm.
+        '''
+        run = [main_log[key] for _, key in self.run_columns]
+        run[0] = str(run[0])
+        run[-1] = float(run[-1])
+        run[-2] = str(run[-2])
+
+        trace = [(run[0], i) + tuple(float(log[c][i]) for c in self.trace_columns)
+                 for i in range(len(log['min']))]
+
+        stats = []
+        if all(key in log for _, key in self.stats_columns):
+            stats = [(run[0], i) + tuple(float(log[key][i]) for _, key in self.stats_columns)
+                     for i in range(len(log['min']))]
+
+        group = (main_log['instance'], main_log['space'], main_log['sampling'])
+
+        with self.conn:
+            # The aggregates are read and written, no other writer in between
+            self.conn.execute('BEGIN IMMEDIATE')
+
+            # The group of a replaced run changes too
+            old_group = self.conn.execute('SELECT instance, space, sampling FROM runs '
+                                          'WHERE id = ?', (run[0],)).fetchone()
+            if old_group is not None:
+                self._remove_from_aggregates(run[0], old_group)
+                self.conn.execute('INSERT OR IGNORE INTO dirty VALUES (?,?,?)', old_group)
+
+            self.conn.execute('INSERT OR REPLACE INTO runs VALUES ('
+                              + ','.join('?'*len(run)) + ')', run)
+            self.conn.execute('DELETE FROM traces WHERE run_id = ?', (run[0],))
+            self.conn.executemany('INSERT INTO traces VALUES (?,?,?,?,?,?)', trace)
+            self.conn.execute('DELETE FROM stats WHERE run_id = ?', (run[0],))
+            self.conn.executemany('INSERT INTO stats VALUES (' 
+                                  + ','.join('?'*(len(self.stats_columns)+2)) + ')', stats)
+
+            # Running count, mean and best of each iteration of the group
+            self.conn.executemany('INSERT INTO aggregates (instance, space, sampling, '
+                                  'iteration, runs, mean, best) VALUES (?,?,?,?,1,?,?) '
+                                  'ON CONFLICT (instance, space, sampling, iteration) DO UPDATE '
+                                  'SET runs = runs + 1, '
+                                  'mean = mean + (excluded.mean - mean)/(runs + 1), '
+                                  'best = MIN(best, excluded.best)',
+                                  [group + (i, v, v) for _, i, v, *_ in trace])
+
+            # Quartile estimates of each iteration of the group
+            states = dict(self.conn.execute('SELECT iteration, state FROM sketches '
+                                            'WHERE instance = ? AND space = ? AND sampling = ?', 
+                                            group))
+            sketches = []
+            quartiles = []
+            for _, i, v, *_ in trace:
+                sketch = QuantileSketch(states.get(i))
+                sketch.add(v)
+                sketches.append(group + (i, sketch.state()))
+                quartiles.append(sketch.quartiles() + group + (i,))
+
+            self.conn.executemany('INSERT OR REPLACE INTO sketches VALUES (?,?,?,?,?)', sketches)
+            self.conn.executemany('UPDATE aggregates SET q25 = ?, median = ?, q75 = ? '
+                                  'WHERE instance = ? AND space = ? AND sampling = ? '
+                                  'AND iteration = ?', quartiles)
+
+    def _where(self, instance, space, sampling):
+        filters = [(c, v) for c, v in (('instance', instance),
+                                       ('space', space),
+                                       ('sampling', sampling)) if v is not None]
+        if len(filters) == 0:
+            return '', ()
+
+        return (' WHERE ' + ' AND '.join('runs.'+c+' = ?' for c, _ in filters),
+                tuple(v for _, v in filters))
+
+    def run_ids(self):
+        '''Identifiers of the saved runs.
+
+        Returns:
+            set: Identifiers of the runs.
+        '''
+        return set(row[0] for row in self.conn.execute('SELECT id FROM runs'))
+
+    def runs(self, instance=None, space=None, sampling=None):
+        '''Metadata of the saved runs, optionally filtered.
+
+        Args:
+            instance (str or None): Only runs of this instance. Default: None.
+            space (str or None): Only runs in this search space. Default: None.
+            sampling (str or None): Only runs with this sampling. Default: None.
+
+        Returns:
+            list: A dict for each run, with the fields of the main log.
+        '''
+        where, values = self._where(instance, space, sampling)
+        rows = self.conn.execute('SELECT * FROM runs' + where, values)
+
+        return [dict(zip([key for _, key in self.run_columns], row)) for row in rows]
+
+    def trace(self, run_id):
+        '''Trace of a run, as returned by the algorithm.
+
+        Args:
+            run_id (str): Identifier of the run.
+
+        Returns:
+            dict: 'min', 'max', 'mean' and 'median' of each generation.
+        '''
+        rows = self.conn.execute('SELECT min, max, mean, median FROM traces '
+                                 'WHERE run_id = ? ORDER BY iteration', (str(run_id),))
+
+        log = {c: [] for c in self.trace_columns}
+        for row in rows:
+            for c, v in zip(self.trace_columns, row):
+                log[c].append(v)
+
+        return log
+
+    def stats(self, run_id):
+        '''Times and counters of each generation of a run, empty lists if 
+        the log of the run had none.
+
+        Args:
+            run_id (str): Identifier of the run.
+
+        Returns:
+            dict: A list for each key of Algorithm.stats_keys.
+        '''
+        rows = self.conn.execute('SELECT ' + ', '.join(c for c, _ in self.stats_columns)
+                                 + ' FROM stats WHERE run_id = ? ORDER BY iteration', 
+                                 (str(run_id),))
+
+        stats = {key: [] for _, key in self.stats_columns}
+        for row in rows:
+            for (_, key), v in zip(self.stats_columns, row):
+                stats[key].append(v)
+
+        return stats
+
+    def traces(self, instance=None, space=None, sampling=None):
+        '''Traces of the saved runs, optionally filtered, joined with the
+        metadata of their run.
+
+        Args:
+            instance (str or None): Only runs of this instance. Default: None.
+            space (str or None): Only runs in this search space. Default: None.
+            sampling (str or None): Only runs with this sampling. Default: None.
+
+        Returns:
+            dict: Columns 'id', 'instance', 'space', 'sampling', 'iteration',
+                  'min', 'max', 'mean' and 'median', one row per generation.
+        '''
+        columns = ['id', 'instance', 'space', 'sampling', 'iteration'] + self.trace_columns
+        where, values = self._where(instance, space, sampling)
+
+        rows = self.conn.execute('SELECT runs.id, runs.instance, runs.space, runs.sampling, '
+                                 'traces.iteration, traces.min, traces.max, '
+                                 'traces.mean, traces.median '
+                                 'FROM traces JOIN runs ON traces.run_id = runs.id' + where
+                                 + ' ORDER BY runs.id, traces.iteration', values)
+
+        data = {c: [] for c in columns}
+        for row in rows:
+            for c, v in zip(columns, row):
+                data[c].append(v)
+
+        return data
+
+    def update_aggregates(self):
+        '''Computes again, from every trace, the aggregates and sketches of the
+        groups (instance, space and sampling) marked by a replaced run or 
+        saved by an older version of the store, the rest are kept up to date
+        by add_run.
+
+        Each group is read and written in one transaction, so that a run 
+        saved by another process meanwhile either is included or leaves the
+        group marked.
+
+        Returns:
+            int: Number of updated groups.
+        '''
+        groups = self.conn.execute('SELECT instance, space, sampling FROM dirty').fetchall()
+
+        for group in groups:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self.conn.execute('SELECT traces.iteration, traces.min '
+                                         'FROM traces JOIN runs ON traces.run_id = runs.id '
+                                         'WHERE runs.instance = ? AND runs.space = ? '
+                                         'AND runs.sampling = ? ORDER BY traces.iteration', 
+                                         group).fetchall()
+
+                aggregates = []
+                sketches = []
+                if len(rows) > 0:
+                    rows = np.array(rows, dtype=np.float64)
+                    iterations, starts = np.unique(rows[:, 0], return_index=True)
+
+                    for iteration, values in zip(iterations, np.split(rows[:, 1], starts[1:])):
+                        # The same estimate that add_run would have built
+                        sketch = QuantileSketch()
+                        for v in values:
+                            sketch.add(v)
+                        q25, median, q75 = sketch.quartiles()
+
+                        aggregates.append(group + (int(iteration), len(values), 
+                                                   float(np.mean(values)), median, 
+                                                   q25, q75, float(np.min(values))))
+                        sketches.append(group + (int(iteration), sketch.state()))
+
+                for table in ('aggregates', 'sketches'):
+                    self.conn.execute('DELETE FROM ' + table + ' WHERE instance = ? '
+                                      'AND space = ? AND sampling = ?', group)
+                self.conn.executemany('INSERT INTO aggregates VALUES (?,?,?,?,?,?,?,?,?,?)', 
+                                      aggregates)
+                self.conn.executemany('INSERT INTO sketches VALUES (?,?,?,?,?)', sketches)
+                self.conn.execute('DELETE FROM dirty WHERE instance = ? '
+                                  'AND space = ? AND sampling = ?', group)
+                self.conn.commit()
+
+            except BaseException:
+                self.conn.rollback()
+                raise
+
+        return len(groups)
+
+    def aggregates(self, instance=None, space=None, sampling=None, last=False):
+        '''Aggregates of the min of the runs of each group (instance, space and
+        sampling) in each iteration: number of runs, mean, median, quartiles 
+        and best value. They are read as saved by add_run, only the groups 
+        with replaced runs are computed again first (see update_aggregates).
+
+        Args:
+            instance (str or None): Only groups of this instance. Default: None.
+            space (str or None): Only groups in this search space. Default: None.
+            sampling (str or None): Only groups with this sampling. Default: None.
+            last (bool): If true, only the last iteration of each group. 
+                         Default: False.
+
+        Returns:
+            dict: A column for each field of the aggregates, one row per group 
+                  and iteration.
+        '''
+        self.update_aggregates()
+
+        where, values = self._where(instance, space, sampling)
+        where = where.replace('runs.', 'a.')
+
+        if last:
+            where += (' AND ' if where else ' WHERE ') + ('a.iteration = '
+                '(SELECT MAX(iteration) FROM aggregates b WHERE b.instance = a.instance '
+                'AND b.space = a.space AND b.sampling = a.sampling)')
+
+        rows = self.conn.execute('SELECT * FROM aggregates a' + where 
+                                 + ' ORDER BY instance, space, sampling, iteration', values)
+
+        data = {c: [] for c in self.aggregate_columns}
+        for row in rows:
+            for c, v in zip(self.aggregate_columns, row):
+                data[c].append(v)
+
+        return data
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()